@@ -0,0 +1,42 @@
+# Decode throughput of Token Metadata accounts (read_meta + build_metadata), per core.
+#
+#   python -m bench.bench_decode [--count 20000] [--workers 4]
+import argparse
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+from bench.synthetic import encode_metadata, make_metadatas
+from modules.metaplex import decode_metadatas
+
+CHUNK = 100  # one getMultipleAccounts batch
+
+def make_accounts(count: int) -> List[Tuple[bytes, str, str, int]]:
+    return [(encode_metadata(d), str(d.minter), str(d.signature), d.blocktime) for d in make_metadatas(count)]
+
+async def decode_parallel(accounts, executor) -> None:
+    loop = asyncio.get_running_loop()
+    chunks = [accounts[i:i + CHUNK] for i in range(0, len(accounts), CHUNK)]
+    await asyncio.gather(*[loop.run_in_executor(executor, decode_metadatas, chunk) for chunk in chunks])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    accounts = make_accounts(args.count)
+
+    start = time.perf_counter()
+    for i in range(0, len(accounts), CHUNK):
+        decode_metadatas(accounts[i:i + CHUNK])
+    elapsed = time.perf_counter() - start
+    print(f" inline: {args.count / elapsed:,.0f} accounts/sec on 1 core")
+
+    with ProcessPoolExecutor(args.workers) as executor:
+        asyncio.run(decode_parallel(accounts[:CHUNK * args.workers], executor))  # warm up the workers
+        start = time.perf_counter()
+        asyncio.run(decode_parallel(accounts, executor))
+        elapsed = time.perf_counter() - start
+    rate = args.count / elapsed
+    print(f"process: {rate:,.0f} accounts/sec on {args.workers} workers, {rate / args.workers:,.0f} per core")
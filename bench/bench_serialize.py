@@ -0,0 +1,81 @@
+# Serialization cost of Mint responses, without a database.
+#
+#   python -m bench.bench_serialize [--count 10000]
+#
+# "legacy" is the former route path: ORM objects, dicts built from __table__.columns, model_validate
+# per creator and FastAPI's response validation plus json encoding. "fast" is mintquery.to_mint_dict
+# over Core row mappings followed by orjson.
+import argparse
+import datetime
+import json
+import time
+import orjson
+from pydantic import TypeAdapter
+from typing import List
+
+from bench.synthetic import make_metadatas
+from modules import metadb, mintquery
+from modules.models.nftmint import NftMint, MintCreator
+from modules.models.resmodel import Mint, Creator
+
+def legacy_to_mint(mint: NftMint) -> Mint:
+    new_creators = [
+                    {
+                        column.name: getattr(ins, column.name)\
+                            for column in ins.__table__.columns if column.name != '_sa_instance_state'
+                    }\
+                    for ins in mint.creators
+                ]
+    creators = [Creator.model_validate(c) for c in new_creators]
+    mint_data = Mint.model_validate(mint)
+    mint_data.creators = creators
+    return mint_data
+
+def make_rows(count: int):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    mint_rows = []
+    creator_rows = {}
+    for i, d in enumerate(make_metadatas(count)):
+        row = metadb.to_mint_row(d)
+        row.update({"id": i + 1, "create_at": now, "last_update": now})
+        mint_rows.append(row)
+        creator_rows[row["mint"]] = [
+                {"id": i * 10 + c_i, "address": c["address"], "verified": c["verified"], "share": c["share"], "create_at": now}
+                for c_i, c in enumerate(metadb.to_creator_rows(d))
+                ]
+    return mint_rows, creator_rows
+
+def make_orm(mint_rows, creator_rows) -> List[NftMint]:
+    mints = []
+    for row in mint_rows:
+        mint = NftMint(**row)
+        mint.creators = [MintCreator(mint_key=row["mint"], creator_order=c_i, **c)
+                for c_i, c in enumerate(creator_rows[row["mint"]])]
+        mints.append(mint)
+    return mints
+
+def bench(name: str, count: int, func) -> None:
+    start = time.perf_counter()
+    size = len(func())
+    elapsed = time.perf_counter() - start
+    print(f"{name:>7}: {count} mints in {elapsed:.3f}s, {count / elapsed:,.0f} mints/sec, {size:,} bytes")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=10000)
+    args = parser.parse_args()
+
+    mint_rows, creator_rows = make_rows(args.count)
+    orm_mints = make_orm(mint_rows, creator_rows)
+    response_adapter = TypeAdapter(List[Mint])
+
+    def legacy():
+        results = [legacy_to_mint(mint) for mint in orm_mints]
+        validated = response_adapter.validate_python(results)
+        return json.dumps(response_adapter.dump_python(validated, mode="json")).encode()
+
+    def fast():
+        return orjson.dumps([mintquery.to_mint_dict(row, creator_rows[row["mint"]]) for row in mint_rows])
+
+    bench("legacy", args.count, legacy)
+    bench("fast", args.count, fast)
@@ -0,0 +1,164 @@
+# Local stand-in for a Solana RPC node serving a synthetic candy machine collection.
+#
+#   python -m bench.mock_rpc [--count 5000] [--latency 0.02] [--port 8899]
+#
+# Answers getSignaturesForAddress (with before/until/limit paging), getTransaction in jsonParsed
+# form, getAccountInfo and getMultipleAccounts. Mint transactions alternate between the Candy Guard
+# layout (minter = accounts[5], mint = accounts[6]) and the Candy Machine layout (minter =
+# accounts[4], mint = accounts[5]) that nftmint.parse_mint_info expects. The metadata uris point at
+# GET /offchain/<mint>.json on the same server, which answers with a Metaplex JSON document
+# (a share of them with 503 when --offchain-error-rate is set).
+import argparse
+import asyncio
+import base64
+import random
+from dataclasses import dataclass
+from solders.pubkey import Pubkey
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from typing import Dict, List, Optional
+
+from bench.synthetic import encode_metadata, make_metadatas
+from modules.metaplex import METADATA_PROGRAM_ID, get_metadata_account
+
+CANDY_GUARD_PROGRAM_ID = "Guard1JwRhJkVH6XZhzoYxeBVQe872VH6QggF4BWmS9g"
+CANDY_MACHINE_PROGRAM_ID = "CndyV3LdqHUfDLmE5naZjVN8rBZz4tqhdefbAnjHG3JR"
+COMPUTE_BUDGET_PROGRAM_ID = "ComputeBudget111111111111111111111111111111"
+SLOT = 250000000
+
+@dataclass
+class Collection:
+    key: str
+    signatures: List[str]  # newest first
+    transactions: Dict[str, Dict]
+    accounts: Dict[str, bytes]
+
+def make_transaction(signature: str, mint: str, minter: str, blocktime: int, guard: bool) -> Dict:
+    accounts = [str(Pubkey.new_unique()) for _ in range(12)]
+    if guard:
+        program_id, accounts[5], accounts[6] = CANDY_GUARD_PROGRAM_ID, minter, mint
+    else:
+        program_id, accounts[4], accounts[5] = CANDY_MACHINE_PROGRAM_ID, minter, mint
+    return {
+            "slot": SLOT,
+            "blockTime": blocktime,
+            "version": 0,
+            "transaction": {
+                "signatures": [signature],
+                "message": {
+                    "accountKeys": [{"pubkey": minter, "writable": True, "signer": True, "source": "transaction"}],
+                    "recentBlockhash": "11111111111111111111111111111111",
+                    "instructions": [
+                        {"programId": COMPUTE_BUDGET_PROGRAM_ID, "accounts": [], "data": "3DTZbgwsozUF", "stackHeight": None},
+                        {"programId": program_id, "accounts": accounts, "data": "3TLTqBRpZ8Ka", "stackHeight": None}
+                        ]
+                    }
+                },
+            "meta": {
+                "err": None, "status": {"Ok": None}, "fee": 5000, "preBalances": [], "postBalances": [],
+                "innerInstructions": [], "logMessages": [], "preTokenBalances": [], "postTokenBalances": [],
+                "rewards": [], "computeUnitsConsumed": 100000
+                }
+            }
+
+TRAITS = {
+        "Background": ["Blue", "Red", "Green", "Gold"],
+        "Eyes": ["Round", "Laser", "Sleepy"],
+        "Hat": ["None", "Cap", "Crown"],
+        }
+
+def make_collection(count: int, seed: int = 0, uri_base: str = "https://example.invalid") -> Collection:
+    collection_key = Pubkey.new_unique()
+    metadatas = make_metadatas(count, collection_key, seed, uri_base)
+    rng = random.Random(seed)
+    transactions = {}
+    accounts = {}
+    for d in metadatas:
+        signature = str(d.signature)
+        transactions[signature] = make_transaction(signature, str(d.mint), str(d.minter), d.blocktime, rng.random() < 0.5)
+        accounts[str(get_metadata_account(str(d.mint)))] = encode_metadata(d)
+    signatures = [str(d.signature) for d in reversed(metadatas)]
+    return Collection(str(collection_key), signatures, transactions, accounts)
+
+def account_json(data: Optional[bytes]) -> Optional[Dict]:
+    if data is None:
+        return None
+    return {"data": [base64.b64encode(data).decode(), "base64"], "executable": False, "lamports": 5616720,
+            "owner": str(METADATA_PROGRAM_ID), "rentEpoch": 0, "space": len(data)}
+
+def offchain_document(mint: str) -> Dict:
+    rng = random.Random(mint)
+    return {
+            "name": f"Synthetic {mint[:8]}",
+            "symbol": "SYN",
+            "description": "Synthetic mint served by bench.mock_rpc",
+            "image": f"https://example.invalid/{mint}.png",
+            "attributes": [{"trait_type": trait_type, "value": rng.choice(values)} for trait_type, values in TRAITS.items()],
+            "properties": {"category": "image"}
+            }
+
+def create_app(collection: Collection, latency: float = 0.0, jitter: float = 0.0,
+        offchain_error_rate: float = 0.0) -> Starlette:
+    positions = {signature: i for i, signature in enumerate(collection.signatures)}
+
+    def signatures_for_address(address: str, config: Optional[Dict] = None) -> List[Dict]:
+        config = config or {}
+        if address != collection.key:
+            return []
+        start = positions[config["before"]] + 1 if config.get("before") in positions else 0
+        end = positions[config["until"]] if config.get("until") in positions else len(collection.signatures)
+        end = min(end, start + (config.get("limit") or 1000))
+        return [{"signature": signature, "slot": SLOT, "err": None, "memo": None,
+                "blockTime": collection.transactions[signature]["blockTime"], "confirmationStatus": "finalized"}
+                for signature in collection.signatures[start:end]]
+
+    methods = {
+            "getSignaturesForAddress": signatures_for_address,
+            "getTransaction": lambda signature, config=None: collection.transactions.get(signature),
+            "getAccountInfo": lambda pubkey, config=None: {"context": {"slot": SLOT},
+                "value": account_json(collection.accounts.get(pubkey))},
+            "getMultipleAccounts": lambda pubkeys, config=None: {"context": {"slot": SLOT},
+                "value": [account_json(collection.accounts.get(pubkey)) for pubkey in pubkeys]},
+            }
+
+    async def rpc(request: Request) -> JSONResponse:
+        body = await request.json()
+        if latency or jitter:
+            await asyncio.sleep(latency + random.uniform(0, jitter))
+        method = methods.get(body["method"])
+        if not method:
+            return JSONResponse({"jsonrpc": "2.0", "id": body["id"],
+                "error": {"code": -32601, "message": "Method not found"}})
+        return JSONResponse({"jsonrpc": "2.0", "id": body["id"], "result": method(*body.get("params", []))})
+
+    async def health(request: Request) -> PlainTextResponse:
+        return PlainTextResponse("ok")
+
+    async def offchain(request: Request) -> JSONResponse:
+        if latency or jitter:
+            await asyncio.sleep(latency + random.uniform(0, jitter))
+        if random.random() < offchain_error_rate:
+            return JSONResponse({"error": "unavailable"}, status_code=503)
+        return JSONResponse(offchain_document(request.path_params["name"].removesuffix(".json")))
+
+    return Starlette(routes=[Route("/", rpc, methods=["POST"]), Route("/health", health),
+        Route("/offchain/{name}", offchain)])
+
+def serve(count: int, latency: float, jitter: float, port: int, seed: int = 0, offchain_error_rate: float = 0.0) -> None:
+    import uvicorn
+    collection = make_collection(count, seed, f"http://127.0.0.1:{port}/offchain")
+    print(f"collection {collection.key}, {count} mints, oldest signature {collection.signatures[-1]}")
+    uvicorn.run(create_app(collection, latency, jitter, offchain_error_rate), port=port, log_level="warning")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, seconds")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--offchain-error-rate", type=float, default=0.0, help="share of off-chain requests failing with 503")
+    args = parser.parse_args()
+    serve(args.count, args.latency, args.jitter, args.port, args.seed, args.offchain_error_rate)
@@ -0,0 +1,65 @@
+import random
+import struct
+import time
+from solders.pubkey import Pubkey
+from solders.signature import Signature
+from modules.metaplex import Metadata, Creator, Collection
+from typing import List
+
+def make_metadatas(count: int, collection: Pubkey = None, seed: int = 0,
+        uri_base: str = "https://example.invalid") -> List[Metadata]:
+    rng = random.Random(seed)
+    collection = collection or Pubkey.new_unique()
+    update_authority = Pubkey.new_unique()
+    minters = [Pubkey.new_unique() for _ in range(max(1, count // 10))]
+    start = int(time.time()) - count * 2
+    metadatas = []
+    for i in range(count):
+        mint = Pubkey.new_unique()
+        metadatas.append(Metadata(
+            "MetadataV1",
+            update_authority,
+            mint,
+            rng.choice(minters),
+            Signature.new_unique(),
+            f"Synthetic #{i}",
+            "SYN",
+            f"{uri_base}/{mint}.json",
+            rng.choice([0, 250, 500, 750, 1000]),
+            [Creator(update_authority, True, 0), Creator(Pubkey.new_unique(), False, 100)],
+            True,
+            True,
+            rng.randrange(256),
+            "NonFungible",
+            Collection(collection, True),
+            None,
+            None,
+            None,
+            start + i * 2
+            ))
+    return metadatas
+
+METADATA_ACCOUNT_SIZE = 679
+
+def _borsh_string(value: str, padded: int) -> bytes:
+    # Token Metadata pads name, symbol and uri with NUL bytes
+    data = value.encode().ljust(padded, b"\x00")
+    return struct.pack("<I", len(data)) + data
+
+def encode_metadata(d: Metadata) -> bytes:
+    # Borsh layout of a Token Metadata account (key = MetadataV1), zero padded to the account size
+    data = bytes([4]) + bytes(d.update_authority) + bytes(d.mint)
+    data += _borsh_string(d.name, 32) + _borsh_string(d.symbol, 10) + _borsh_string(d.uri, 200)
+    data += struct.pack("<H", d.seller_fee_basis_points)
+    if d.creators:
+        data += b"\x01" + struct.pack("<I", len(d.creators))
+        for c in d.creators:
+            data += bytes(c.address) + bytes([int(c.verified), c.share])
+    else:
+        data += b"\x00"
+    data += bytes([int(d.primary_sale_happened), int(d.is_mutable)])
+    data += bytes([1, d.edition_nonce]) if d.edition_nonce is not None else b"\x00"
+    data += bytes([1, 0]) if d.token_standard else b"\x00"  # 0 = NonFungible
+    data += bytes([1, int(d.collection.verified)]) + bytes(d.collection.key) if d.collection else b"\x00"
+    data += b"\x00\x00\x00"  # uses, collection_details, programmable_config
+    return data.ljust(METADATA_ACCOUNT_SIZE, b"\x00")
@@ -1,78 +1,44 @@
 import asyncio
-from fastapi import FastAPI, HTTPException
-from sqlalchemy import select
+import logging
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.exc import ArgumentError
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, async_sessionmaker
-from modules.models.nftmint import NftMintBase, NftMint
-from modules.models.resmodel import Mint, Creator 
+from sqlalchemy.ext.asyncio import AsyncSession
+from modules.models.nftmint import NftMint
+from modules.models.resmodel import Mint, MintBatch, MintBatchRequest, MintPage
 from contextlib import asynccontextmanager
-from typing import Dict, List
+from typing import Dict, List, Literal, Optional, Tuple
 from dotenv import dotenv_values 
-from pydantic import BaseSettings
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import exc
-import os
-
-from modules import nftmint
-
-class Settings(BaseSettings):
-    
-    postgres_prod: str
-    postgres_dev: str
-    collectionkey: str
-    candy_program_id: str
-    candy_guard_id: str
-    candy_mint_acc: str
-    mintsignature: str
-    frontend_url: str
-    sol_endpoint: str
-    
-    class Config:
-        if os.getenv("ENV") == "production":
-            env_file = None  # Use system env variables
-        else:
-            env_file = ".env"  # Use .env file for development
-            
-
-async def run_app(sol_endpoint: str, pubkeys: Dict, engine: AsyncEngine, lastsig: str) -> None:
-    first_args = {"lastsignature": lastsig, 
-            "running": False}
-    if not first_args["running"]:
-        try:
-            async_session = async_sessionmaker(engine, expire_on_commit=False)
-            async with async_session() as session:
-                stmt = select(NftMint.signature).order_by(NftMint.blocktime.desc())
-                result = await session.scalars(stmt)
-                latest_signature = result.first()
-                if latest_signature:
-                    first_args["lastsignature"] = latest_signature
-            await nftmint.update_mint(settings.sol_endpoint, pubkeys, async_session, first_args)
-        except:
-            pass
-        
+import orjson
+
+from modules import ingest, metrics, mintcache, mintfeed, mintquery, mintstats, offchain
+from modules.config import Settings
+from modules.database import db_route, engine_from_settings, create_session_factory, get_session, instrument_engine, pool_stats
+
+logger = logging.getLogger(__name__)
+
 settings = Settings()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global engine
-    if os.getenv("ENV") == "production":
-        engine = create_async_engine(settings.postgres_prod)
-    else:
-        engine = create_async_engine(settings.postgres_dev)
-        pubkeys = {
-            "collection": settings.collectionkey, 
-            "candyprogid": settings.candy_program_id,
-            "candyguardgid": settings.candy_guard_id,
-            "candymintacc": settings.candy_mint_acc,
-               } 
-    try:
-        async with engine.begin() as conn:
-            await conn.run_sync(NftMintBase.metadata.create_all)
-        asyncio.create_task(run_app(settings.sol_endpoint, pubkeys, engine, settings.mintsignature))
-    except:
-        pass
+    engine = engine_from_settings(settings)
+    instrument_engine(engine)
+    app.state.engine = engine
+    app.state.async_session = create_session_factory(engine)
+    mintcache.configure(settings.cache_maxsize, settings.cache_ttl, settings.cache_edge_ttl)
+    # new mints reach the feed through LISTEN/NOTIFY, also when the ingester runs in another process
+    feed = asyncio.create_task(mintfeed.configure(settings.feed_buffer_size).listen(engine, app.state.async_session))
+    ingester = None
+    if settings.embedded_ingester:
+        # single process deployments; still elected through the advisory lock
+        ingester = asyncio.create_task(ingest.run_leader(settings, engine))
     yield
-    engine.dispose()
+    if ingester:
+        ingester.cancel()
+    feed.cancel()
+    await engine.dispose()
 
 origins = [
     settings.frontend_url
@@ -86,147 +52,219 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.get("/")
-async def get_all():
-    if os.getenv("ENV") == "production":
-        engine = create_async_engine(settings.postgres_prod)
-    else:
-        engine = create_async_engine(settings.postgres_dev)
-    results = []
+@app.get("/", response_model=MintPage, response_class=ORJSONResponse)
+async def get_all(limit: int = Query(100, ge=1, le=1000), after: Optional[int] = None,
+        minter: Optional[str] = None, symbol: Optional[str] = None, collection_key: Optional[str] = None,
+        creator: Optional[str] = None, since: Optional[int] = None, until: Optional[int] = None,
+        trait: List[str] = Query([], description="trait_type:value, repeat to require several"),
+        stream: bool = False, session: AsyncSession = Depends(get_session)):
+    traits = [tuple(item.split(":", 1)) for item in trait]
+    if any(len(item) != 2 for item in traits):
+        raise HTTPException(status_code=400, detail="trait must be trait_type:value")
+    filters = {"minter": minter, "symbol": symbol, "collection_key": collection_key, "creator": creator,
+            "since": since, "until": until, "traits": traits}
+    if stream:
+        async def ndjson():
+            # the body is sent after the handler returned, outside the request's context
+            db_route.set("/")
+            async with app.state.async_session() as stream_session:
+                async for mint in mintquery.stream_mints(stream_session, after, **filters):
+                    yield orjson.dumps(mint) + b"\n"
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+    return await mint_page(session, limit, after, **filters)
+
+async def mint_page(session: AsyncSession, limit: int, after: Optional[int], **filters) -> ORJSONResponse:
     try:
-        async_session = async_sessionmaker(engine, expire_on_commit=False)
-        async with async_session() as session:
-            stmt = select(NftMint)
-            res = await session.scalars(stmt)
-            mints = res.all()
-            for mint in mints:
-                new_creators = [
-                                {
-                                    column.name: getattr(ins, column.name)\
-                                        for column in ins.__table__.columns if column.name != '_sa_instance_state'
-                                }\
-                                for ins in mint.creators
-                            ]
-                creators = [Creator.model_validate(c) for c in new_creators]
-                mint_data = Mint.model_validate(mint)
-                mint_data.creators = creators
-                results.append(mint_data)
-    except:
+        mints = await mintquery.list_mints(session, limit, after, **filters)
+    except exc.SQLAlchemyError:
         raise HTTPException(status_code=400, detail="Connection fail")
-    return results
+    return ORJSONResponse({"items": mints, "next": mints[-1]["id"] if len(mints) == limit else None})
 
-@app.get("/mint/from-name/{name}")
-async def get_mint_by_name(name: str):
-    if os.getenv("ENV") == "production":
-        engine = create_async_engine(settings.postgres_prod)
-    else:
-        engine = create_async_engine(settings.postgres_dev)
-    async_session = async_sessionmaker(engine, expire_on_commit=False)
-    result = None
-    async with async_session() as session:
+@app.get("/pool")
+async def get_pool_stats() -> Dict:
+    return pool_stats(app.state.engine)
+
+@app.get("/cache")
+async def get_cache_stats() -> Dict:
+    return mintcache.mint_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    for state, value in pool_stats(app.state.engine).items():
+        if state != "status":
+            metrics.DB_POOL.set(value, state=state)
+    for stat, value in mintcache.mint_cache.stats().items():
+        metrics.CACHE.set(value, stat=stat)
+    for stat, value in mintfeed.mint_feed.stats().items():
+        metrics.FEED.set(value, stat=stat)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def cache_key(key: Tuple[str, str], collection_key: Optional[str]) -> Tuple[str, ...]:
+    return key + (collection_key,) if collection_key else key
+
+async def cached_mint(session: AsyncSession, key: Tuple[str, ...], stmt) -> Optional[Dict]:
+    mint = mintcache.mint_cache.get(key)
+    if mint is None:
+        try:
+            mint = await mintquery.first_mint(session, stmt)
+            if mint:
+                mintcache.mint_cache.set(key, mint)
+        except exc.SQLAlchemyError:
+            logger.exception("mint query failed")
+            raise HTTPException(status_code=400, detail="Connection fail")
+    return mint
+
+FEED_REPLAY_LIMIT = 1000
+
+def sse_event(mint: Dict) -> bytes:
+    return b"id: %d\nevent: mint\ndata: %s\n\n" % (mint["id"], orjson.dumps(mint))
+
+@app.get("/mint/feed")
+async def get_mint_feed(collection_key: Optional[str] = None, last_event_id: Optional[int] = Header(None)):
+    # Server-Sent Events, one "mint" event per new mint. A reconnecting EventSource sends the id of
+    # the last event it got and first receives what it missed, up to FEED_REPLAY_LIMIT mints.
+    queue = mintfeed.mint_feed.subscribe()
+    async def events():
+        db_route.set("/mint/feed")
+        last_id = last_event_id
         try:
-            stmt = select(NftMint).where(NftMint.name == name)
-            res = await session.scalars(stmt)
-            mint = res.first()
-            new_creators = [
-                            {
-                                column.name: getattr(ins, column.name)\
-                                    for column in ins.__table__.columns if column.name != '_sa_instance_state'
-                            }\
-                            for ins in mint.creators
-                        ]
-            creators = [Creator.model_validate(c) for c in new_creators]
-            result = Mint.model_validate(mint)
-            result.creators = creators
-        except exc.SQLAlchemyError as e:
-            print(type(e))
+            if last_id is not None:
+                async with app.state.async_session() as session:
+                    for mint in await mintquery.list_mints(session, FEED_REPLAY_LIMIT, last_id,
+                            collection_key=collection_key):
+                        last_id = mint["id"]
+                        yield sse_event(mint)
+            while True:
+                try:
+                    mint = await asyncio.wait_for(queue.get(), settings.feed_keepalive)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if collection_key and mint["collection_key"] != collection_key:
+                    continue
+                # skip mints already sent by the replay
+                if last_id is None or mint["id"] > last_id:
+                    yield sse_event(mint)
+        finally:
+            mintfeed.mint_feed.unsubscribe(queue)
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+async def cached_mints(session: AsyncSession, kind: str, keys: List[str], collection_key: Optional[str]) -> Dict[str, Dict]:
+    # cache first, then one query for everything the cache did not have
+    found = {}
+    for key in keys:
+        mint = mintcache.mint_cache.get(cache_key((kind, key), collection_key))
+        if mint:
+            found[key] = mint
+    missing = [key for key in keys if key not in found]
+    if missing:
+        column = NftMint.mint if kind == "address" else NftMint.name
+        loaded = await mintquery.mints_by_keys(session, column, missing, collection_key)
+        for key, mint in loaded.items():
+            mintcache.mint_cache.set(cache_key((kind, key), collection_key), mint)
+        found.update(loaded)
+    return found
+
+@app.post("/mint/batch", response_model=MintBatch, response_class=ORJSONResponse)
+async def get_mint_batch(request: MintBatchRequest, session: AsyncSession = Depends(get_session)):
+    if request.addresses:
+        kind, keys, collection_key = "address", request.addresses, None
+    else:
+        kind, keys, collection_key = "name", request.names, request.collection_key
+    try:
+        found = await cached_mints(session, kind, list(dict.fromkeys(keys)), collection_key)
+    except exc.SQLAlchemyError:
+        raise HTTPException(status_code=400, detail="Connection fail")
+    return ORJSONResponse({"items": [found.get(key) for key in keys], "missing": [key for key in keys if key not in found]})
+
+@app.get("/mint/from-name/{name}", response_model=Mint, response_class=ORJSONResponse)
+async def get_mint_by_name(name: str, collection_key: Optional[str] = None, session: AsyncSession = Depends(get_session)):
+    stmt = mintquery.filter_mints(mintquery.mint_select().where(NftMint.name == name), collection_key=collection_key)
+    result = await cached_mint(session, cache_key(("name", name), collection_key), stmt.order_by(NftMint.id))
     if not result:
         raise HTTPException(status_code=400, detail=f'No mint name "{name}"')
-    return result
+    return ORJSONResponse(result)
 
-@app.get("/mint/from-address/{address}")
-async def get_mint_by_name(address: str) -> Mint:
-    if os.getenv("ENV") == "production":
-        engine = create_async_engine(settings.postgres_prod)
-    else:
-        engine = create_async_engine(settings.postgres_dev)
-    async_session = async_sessionmaker(engine, expire_on_commit=False)
-    result = None
-    async with async_session() as session:
-        try:
-            stmt = select(NftMint).where(NftMint.mint == address)
-            res = await session.scalars(stmt)
-            mint = res.first()
-            new_creators = [
-                            {
-                                column.name: getattr(ins, column.name)\
-                                    for column in ins.__table__.columns if column.name != '_sa_instance_state'
-                            }\
-                            for ins in mint.creators
-                        ]
-            creators = [Creator.model_validate(c) for c in new_creators]
-            result = Mint.model_validate(mint)
-            result.creators = creators
-        except exc.SQLAlchemyError as e:
-            print(type(e))
+@app.get("/mint/from-address/{address}", response_model=Mint, response_class=ORJSONResponse)
+async def get_mint_by_address(address: str, session: AsyncSession = Depends(get_session)):
+    result = await cached_mint(session, ("address", address), mintquery.mint_select().where(NftMint.mint == address))
     if not result:
-        raise HTTPException(status_code=400, detail=f'No mint name "{mint}"')
-    return result
+        raise HTTPException(status_code=400, detail=f'No mint address "{address}"')
+    return ORJSONResponse(result)
 
-@app.get("/mint/newest")
-async def get_mint_by_name() -> Mint:
-    if os.getenv("ENV") == "production":
-        engine = create_async_engine(settings.postgres_prod)
-    else:
-        engine = create_async_engine(settings.postgres_dev)
-    async_session = async_sessionmaker(engine, expire_on_commit=False)
-    result = None
-    async with async_session() as session:
-        try:
-            stmt = select(NftMint).order_by(NftMint.id.desc())
-            res = await session.scalars(stmt)
-            mint = res.first()
-            new_creators = [
-                            {
-                                column.name: getattr(ins, column.name)\
-                                    for column in ins.__table__.columns if column.name != '_sa_instance_state'
-                            }\
-                            for ins in mint.creators
-                        ]
-            creators = [Creator.model_validate(c) for c in new_creators]
-            result = Mint.model_validate(mint)
-            result.creators = creators
-        except exc.SQLAlchemyError as e:
-            print(type(e))
+@app.get("/mint/newest", response_model=Mint, response_class=ORJSONResponse)
+async def get_newest_mint(collection_key: Optional[str] = None, session: AsyncSession = Depends(get_session)):
+    stmt = mintquery.filter_mints(mintquery.mint_select(), collection_key=collection_key)
+    stmt = stmt.order_by(NftMint.blocktime.desc(), NftMint.id.desc())
+    result = await cached_mint(session, cache_key(("edge", "newest"), collection_key), stmt)
     if not result:
         raise HTTPException(status_code=400, detail=f'No mint found"')
-    return result
+    return ORJSONResponse(result)
 
-@app.get("/mint/oldest")
-async def get_mint_by_name() -> Mint:
-    if os.getenv("ENV") == "production":
-        engine = create_async_engine(settings.postgres_prod)
-    else:
-        engine = create_async_engine(settings.postgres_dev)
-    async_session = async_sessionmaker(engine, expire_on_commit=False)
-    result = None
-    async with async_session() as session:
-        try:
-            stmt = select(NftMint).order_by(NftMint.id.asc())
-            res = await session.scalars(stmt)
-            mint = res.first()
-            new_creators = [
-                            {
-                                column.name: getattr(ins, column.name)\
-                                    for column in ins.__table__.columns if column.name != '_sa_instance_state'
-                            }\
-                            for ins in mint.creators
-                        ]
-            creators = [Creator.model_validate(c) for c in new_creators]
-            result = Mint.model_validate(mint)
-            result.creators = creators
-        except exc.SQLAlchemyError as e:
-            print(type(e))
+@app.get("/mint/oldest", response_model=Mint, response_class=ORJSONResponse)
+async def get_oldest_mint(collection_key: Optional[str] = None, session: AsyncSession = Depends(get_session)):
+    stmt = mintquery.filter_mints(mintquery.mint_select(), collection_key=collection_key)
+    stmt = stmt.order_by(NftMint.blocktime.asc(), NftMint.id.asc())
+    result = await cached_mint(session, cache_key(("edge", "oldest"), collection_key), stmt)
     if not result:
         raise HTTPException(status_code=400, detail=f'No mint found"')
-    return result
+    return ORJSONResponse(result)
+
+@app.get("/mint/from-minter/{minter}", response_model=MintPage, response_class=ORJSONResponse)
+async def get_mints_by_minter(minter: str, limit: int = Query(100, ge=1, le=1000), after: Optional[int] = None,
+        collection_key: Optional[str] = None, session: AsyncSession = Depends(get_session)):
+    return await mint_page(session, limit, after, minter=minter, collection_key=collection_key)
+
+@app.get("/creator/from-address/{address}", response_model=MintPage, response_class=ORJSONResponse)
+async def get_mints_by_creator(address: str, limit: int = Query(100, ge=1, le=1000), after: Optional[int] = None,
+        collection_key: Optional[str] = None, session: AsyncSession = Depends(get_session)):
+    return await mint_page(session, limit, after, creator=address, collection_key=collection_key)
+
+@app.get("/mint/attributes/{address}", response_class=ORJSONResponse)
+async def get_mint_attributes(address: str, session: AsyncSession = Depends(get_session)):
+    result = await offchain.load_mint_offchain(session, address)
+    if not result:
+        raise HTTPException(status_code=400, detail=f'No mint address "{address}"')
+    return ORJSONResponse(result)
+
+@app.get("/traits", response_class=ORJSONResponse)
+async def get_traits(collection_key: Optional[str] = None, session: AsyncSession = Depends(get_session)):
+    return ORJSONResponse(await mintquery.trait_counts(session, collection_key))
+
+@app.get("/stats", response_class=ORJSONResponse)
+async def get_stats(collection_key: Optional[str] = None, session: AsyncSession = Depends(get_session)):
+    return ORJSONResponse(await mintstats.summary(session, collection_key))
+
+@app.get("/stats/hourly", response_class=ORJSONResponse)
+async def get_hourly_stats(collection_key: Optional[str] = None, since: Optional[int] = None, until: Optional[int] = None,
+        session: AsyncSession = Depends(get_session)):
+    return ORJSONResponse(await mintstats.hourly(session, collection_key, since, until))
+
+@app.get("/stats/minters", response_class=ORJSONResponse)
+async def get_minter_stats(collection_key: Optional[str] = None, limit: int = Query(100, ge=1, le=1000),
+        session: AsyncSession = Depends(get_session)):
+    return ORJSONResponse(await mintstats.top_minters(session, collection_key, limit))
+
+@app.get("/stats/royalties", response_class=ORJSONResponse)
+async def get_royalty_stats(collection_key: Optional[str] = None, session: AsyncSession = Depends(get_session)):
+    return ORJSONResponse(await mintstats.royalties(session, collection_key))
+
+@app.get("/stats/creators", response_class=ORJSONResponse)
+async def get_creator_stats(collection_key: Optional[str] = None, limit: int = Query(100, ge=1, le=1000),
+        session: AsyncSession = Depends(get_session)):
+    return ORJSONResponse(await mintstats.top_creators(session, collection_key, limit))
+
+@app.get("/stats/histogram/{field}", response_class=ORJSONResponse)
+async def get_histogram(field: Literal["blocktime", "royalty", "mints_per_minter"], bins: int = Query(20, ge=1, le=1000),
+        collection_key: Optional[str] = None, since: Optional[int] = None, until: Optional[int] = None,
+        session: AsyncSession = Depends(get_session)):
+    # bucketed from the rollups, blocktime at hour resolution
+    if field == "blocktime":
+        rows = await mintstats.hourly(session, collection_key, since, until)
+        result = mintstats.histogram([row["hour"] for row in rows], [row["mints"] for row in rows], bins)
+    elif field == "royalty":
+        rows = await mintstats.royalties(session, collection_key)
+        result = mintstats.histogram([row["seller_fee_basis_points"] for row in rows], [row["mints"] for row in rows], bins)
+    else:
+        result = mintstats.histogram(await mintstats.minter_counts(session, collection_key), bins=bins)
+    return ORJSONResponse(result)
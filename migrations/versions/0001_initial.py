@@ -0,0 +1,83 @@
+"""mint, creator and sync_cursor tables
+
+Databases created by the former create_all() call already match this revision,
+mark them with `alembic stamp 0001` before upgrading.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "mint",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("update_authority", sa.String(), nullable=False),
+        sa.Column("mint", sa.String(), nullable=False),
+        sa.Column("minter", sa.String(), nullable=False),
+        sa.Column("signature", sa.String(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("symbol", sa.String(), nullable=False),
+        sa.Column("uri", sa.String(), nullable=False),
+        sa.Column("seller_fee_basis_points", sa.Integer(), nullable=False),
+        sa.Column("primary_sale_happened", sa.Integer(), nullable=False),
+        sa.Column("is_mutable", sa.Boolean(), nullable=False),
+        sa.Column("edition_nonce", sa.Integer(), nullable=True),
+        sa.Column("token_standard", sa.String(), nullable=True),
+        sa.Column("collection_key", sa.String(), nullable=True),
+        sa.Column("collection_verified", sa.Boolean(), nullable=True),
+        sa.Column("uses_use_method", sa.String(), nullable=True),
+        sa.Column("uses_remaining", sa.Integer(), nullable=True),
+        sa.Column("uses_total", sa.Integer(), nullable=True),
+        sa.Column("collection_details_label", sa.String(), nullable=True),
+        sa.Column("collection_details_size", sa.Integer(), nullable=True),
+        sa.Column("programmable_config_label", sa.String(), nullable=True),
+        sa.Column("programmable_config_rule_set", sa.String(), nullable=True),
+        sa.Column("blocktime", sa.Integer(), nullable=False),
+        sa.Column("mint_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("create_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("last_update", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("mint"),
+        sa.UniqueConstraint("name"),
+        sa.UniqueConstraint("uri"),
+    )
+    op.create_table(
+        "creator",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("address", sa.String(), nullable=False),
+        sa.Column("verified", sa.Boolean(), nullable=False),
+        sa.Column("share", sa.Integer(), nullable=False),
+        sa.Column("mint_key", sa.String(), nullable=False),
+        sa.Column("creator_order", sa.Integer(), nullable=False),
+        sa.Column("create_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["mint_key"], ["mint.mint"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "sync_cursor",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("until_signature", sa.String(), nullable=True),
+        sa.Column("before_signature", sa.String(), nullable=True),
+        sa.Column("head_signature", sa.String(), nullable=True),
+        sa.Column("update_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("sync_cursor")
+    op.drop_table("creator")
+    op.drop_table("mint")
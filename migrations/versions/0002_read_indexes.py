@@ -0,0 +1,36 @@
+"""indexes for blocktime, minter and creator lookups
+
+Built concurrently so a live table is not locked while they are created.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = (
+    ("ix_mint_blocktime", "mint", ["blocktime"]),
+    ("ix_mint_minter", "mint", ["minter"]),
+    ("ix_creator_mint_key", "creator", ["mint_key"]),
+    ("ix_creator_address", "creator", ["address"]),
+)
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
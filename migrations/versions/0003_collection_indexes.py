@@ -0,0 +1,33 @@
+"""per collection name uniqueness and collection index
+
+Mint names only need to be unique within a collection once several collections are indexed.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index("uq_mint_collection_key_name", "mint", ["collection_key", "name"], unique=True,
+                postgresql_concurrently=True, if_not_exists=True)
+        op.create_index("ix_mint_collection_key_id", "mint", ["collection_key", "id"],
+                postgresql_concurrently=True, if_not_exists=True)
+    op.drop_constraint("mint_name_key", "mint", type_="unique")
+
+
+def downgrade() -> None:
+    op.create_unique_constraint("mint_name_key", "mint", ["name"])
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_mint_collection_key_id", table_name="mint", postgresql_concurrently=True, if_exists=True)
+        op.drop_index("uq_mint_collection_key_name", table_name="mint", postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,80 @@
+"""rollup tables for the /stats routes
+
+The rollups are filled from the existing mints here and maintained by the ingester afterwards.
+Stop the ingester while upgrading, mints written during the upgrade would be counted twice.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stats_mint_hourly",
+        sa.Column("collection_key", sa.String(), nullable=False),
+        sa.Column("hour", sa.Integer(), nullable=False),
+        sa.Column("mints", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("collection_key", "hour"),
+    )
+    op.create_table(
+        "stats_minter",
+        sa.Column("collection_key", sa.String(), nullable=False),
+        sa.Column("minter", sa.String(), nullable=False),
+        sa.Column("mints", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("collection_key", "minter"),
+    )
+    op.create_index("ix_stats_minter_collection_key_mints", "stats_minter", ["collection_key", "mints"])
+    op.create_table(
+        "stats_royalty",
+        sa.Column("collection_key", sa.String(), nullable=False),
+        sa.Column("seller_fee_basis_points", sa.Integer(), nullable=False),
+        sa.Column("mints", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("collection_key", "seller_fee_basis_points"),
+    )
+    op.create_table(
+        "stats_creator",
+        sa.Column("collection_key", sa.String(), nullable=False),
+        sa.Column("address", sa.String(), nullable=False),
+        sa.Column("mints", sa.Integer(), nullable=False),
+        sa.Column("verified_mints", sa.Integer(), nullable=False),
+        sa.Column("share_total", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("collection_key", "address"),
+    )
+    op.create_index("ix_stats_creator_collection_key_mints", "stats_creator", ["collection_key", "mints"])
+
+    op.execute("""
+        INSERT INTO stats_mint_hourly (collection_key, hour, mints)
+        SELECT coalesce(collection_key, ''), blocktime / 3600 * 3600, count(*) FROM mint GROUP BY 1, 2
+    """)
+    op.execute("""
+        INSERT INTO stats_minter (collection_key, minter, mints)
+        SELECT coalesce(collection_key, ''), minter, count(*) FROM mint GROUP BY 1, 2
+    """)
+    op.execute("""
+        INSERT INTO stats_royalty (collection_key, seller_fee_basis_points, mints)
+        SELECT coalesce(collection_key, ''), seller_fee_basis_points, count(*) FROM mint GROUP BY 1, 2
+    """)
+    op.execute("""
+        INSERT INTO stats_creator (collection_key, address, mints, verified_mints, share_total)
+        SELECT coalesce(m.collection_key, ''), c.address, count(*), sum(CASE WHEN c.verified THEN 1 ELSE 0 END),
+            sum(c.share)
+        FROM creator c JOIN mint m ON m.mint = c.mint_key GROUP BY 1, 2
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table("stats_creator")
+    op.drop_table("stats_royalty")
+    op.drop_table("stats_minter")
+    op.drop_table("stats_mint_hourly")
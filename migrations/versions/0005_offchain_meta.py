@@ -0,0 +1,49 @@
+"""offchain_meta and mint_attribute tables
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "offchain_meta",
+        sa.Column("uri_hash", sa.String(), nullable=False),
+        sa.Column("uri", sa.String(), nullable=False),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("image", sa.String(), nullable=True),
+        sa.Column("animation_url", sa.String(), nullable=True),
+        sa.Column("external_url", sa.String(), nullable=True),
+        sa.Column("document", sa.JSON().with_variant(postgresql.JSONB(), "postgresql"), nullable=False),
+        sa.Column("fetched_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("uri_hash"),
+    )
+    op.create_table(
+        "mint_attribute",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("mint_key", sa.String(), nullable=False),
+        sa.Column("trait_type", sa.String(), nullable=False),
+        sa.Column("value", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(["mint_key"], ["mint.mint"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_mint_attribute_mint_key", "mint_attribute", ["mint_key"])
+    op.create_index("ix_mint_attribute_trait_type_value", "mint_attribute", ["trait_type", "value"])
+
+
+def downgrade() -> None:
+    op.drop_table("mint_attribute")
+    op.drop_table("offchain_meta")
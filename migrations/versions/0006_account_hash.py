@@ -0,0 +1,26 @@
+"""mint.account_hash for the metadata refresher
+
+Existing rows start without a hash, the first refresh pass rewrites their mutable mints once.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("mint", sa.Column("account_hash", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("mint", "account_hash")
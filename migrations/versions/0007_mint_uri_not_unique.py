@@ -0,0 +1,25 @@
+"""drop the unique constraint on mint.uri
+
+Candy Machine hidden settings give every mint of a drop the same uri until the reveal.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_constraint("mint_uri_key", "mint", type_="unique")
+
+
+def downgrade() -> None:
+    op.create_unique_constraint("mint_uri_key", "mint", ["uri"])
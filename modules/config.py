@@ -0,0 +1,119 @@
+from pydantic import BaseSettings
+from modules.offchain import OffchainConfig
+from modules.pipeline import PipelineConfig
+from modules.refresher import RefreshConfig
+from typing import Dict, List, Optional
+import os
+import yaml
+
+class Settings(BaseSettings):
+    
+    postgres_prod: str
+    postgres_dev: str
+    collectionkey: Optional[str] = None
+    candy_program_id: str
+    candy_guard_id: str
+    candy_mint_acc: Optional[str] = None
+    mintsignature: Optional[str] = None
+    collections_file: Optional[str] = None
+    frontend_url: str
+    sol_endpoint: str
+    sol_ws_endpoint: Optional[str] = None
+    ingest_mode: str = "poll"  # "poll" or "stream"
+    embedded_ingester: bool = False
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_recycle: int = 1800
+    db_pool_timeout: int = 30
+    db_pool_pre_ping: bool = True
+    db_batch_size: int = 1000
+    cache_maxsize: int = 10000
+    cache_ttl: float = 3600
+    cache_edge_ttl: float = 60
+    rpc_concurrency: int = 8
+    rpc_rate_limit: float = 0
+    pipeline_queue_size: int = 1000
+    pipeline_flush_interval: float = 2.0
+    decode_executor: str = "thread"
+    decode_workers: int = 1
+    rpc_cache_path: Optional[str] = None
+    metrics_port: int = 0
+    feed_buffer_size: int = 100
+    feed_keepalive: float = 15
+    offchain_enabled: bool = False
+    offchain_concurrency: int = 16
+    offchain_timeout: float = 10
+    offchain_retries: int = 3
+    ipfs_gateway: str = "https://ipfs.io/ipfs/"
+    arweave_gateway: str = "https://arweave.net/"
+    offchain_allow_private_hosts: bool = False
+    refresh_enabled: bool = False
+    refresh_rate: float = 50
+    refresh_interval: float = 3600
+    refresh_batch_size: int = 1000
+    
+    class Config:
+        if os.getenv("ENV") == "production":
+            env_file = None  # Use system env variables
+        else:
+            env_file = ".env"  # Use .env file for development
+
+    def database_url(self) -> str:
+        return self.postgres_prod if os.getenv("ENV") == "production" else self.postgres_dev
+
+    def pubkeys(self) -> Dict:
+        return {
+            "collection": self.collectionkey, 
+            "candyprogid": self.candy_program_id,
+            "candyguardgid": self.candy_guard_id,
+            "candymintacc": self.candy_mint_acc,
+               } 
+
+    def collections(self) -> List[Dict]:
+        # Collections to index, from the COLLECTIONS_FILE yaml or the single COLLECTIONKEY. Program ids
+        # default to CANDY_PROGRAM_ID/CANDY_GUARD_ID, the fetch concurrency to RPC_CONCURRENCY.
+        if not self.collections_file:
+            if not self.collectionkey:
+                raise ValueError("set COLLECTIONKEY or COLLECTIONS_FILE")
+            return [dict(self.pubkeys(), mintsignature=self.mintsignature, concurrency=self.rpc_concurrency)]
+        with open(self.collections_file) as f:
+            entries = yaml.safe_load(f)["collections"]
+        return [{
+            "collection": entry["collection"],
+            "candyprogid": entry.get("candy_program_id", self.candy_program_id),
+            "candyguardgid": entry.get("candy_guard_id", self.candy_guard_id),
+            "candymintacc": entry.get("candy_mint_acc"),
+            "mintsignature": entry.get("mint_signature"),
+            "concurrency": entry.get("concurrency", self.rpc_concurrency)
+               } for entry in entries]
+
+    def pipeline_config(self, fetch_workers: Optional[int] = None) -> PipelineConfig:
+        return PipelineConfig(
+            fetch_workers=fetch_workers or self.rpc_concurrency,
+            queue_size=self.pipeline_queue_size,
+            sink_batch_size=self.db_batch_size,
+            flush_interval=self.pipeline_flush_interval,
+            decode_executor=self.decode_executor,
+            decode_workers=self.decode_workers,
+            rpc_cache_path=self.rpc_cache_path,
+            offchain=self.offchain_config()
+               )
+
+    def offchain_config(self) -> Optional[OffchainConfig]:
+        if not self.offchain_enabled:
+            return None
+        return OffchainConfig(
+            concurrency=self.offchain_concurrency,
+            timeout=self.offchain_timeout,
+            retries=self.offchain_retries,
+            ipfs_gateway=self.ipfs_gateway,
+            arweave_gateway=self.arweave_gateway,
+            allow_private_hosts=self.offchain_allow_private_hosts
+               )
+
+    def refresh_config(self) -> RefreshConfig:
+        return RefreshConfig(
+            rate=self.refresh_rate,
+            interval=self.refresh_interval,
+            batch_size=self.refresh_batch_size
+               )
@@ -0,0 +1,67 @@
+import time
+from contextvars import ContextVar
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, async_sessionmaker, AsyncSession
+from typing import AsyncIterator, Dict
+from modules.metrics import DB_QUERY_LATENCY
+
+# route template of the request using the session, statements outside requests count as "ingest"
+db_route: ContextVar[str] = ContextVar("db_route", default="ingest")
+
+def create_engine(url: str, pool_size: int = 5, max_overflow: int = 10, pool_recycle: int = 1800,
+        pool_timeout: int = 30, pool_pre_ping: bool = True) -> AsyncEngine:
+    return create_async_engine(
+            url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_recycle=pool_recycle,
+            pool_timeout=pool_timeout,
+            pool_pre_ping=pool_pre_ping
+            )
+
+def create_session_factory(engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+def pool_stats(engine: AsyncEngine) -> Dict:
+    pool = engine.sync_engine.pool
+    return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "status": pool.status()
+            }
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_LATENCY.observe(time.perf_counter() - conn.info["query_start"].pop(), route=db_route.get())
+
+    def handle_error(context):
+        # failed statements never reach after_cursor_execute
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - starts.pop(), route=db_route.get())
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", handle_error)
+
+async def get_session(request: Request) -> AsyncIterator[AsyncSession]:
+    route = request.scope.get("route")
+    db_route.set(route.path if route else request.url.path)
+    async with request.app.state.async_session() as session:
+        yield session
+
+def engine_from_settings(settings) -> AsyncEngine:
+    return create_engine(
+            settings.database_url(),
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_recycle=settings.db_pool_recycle,
+            pool_timeout=settings.db_pool_timeout,
+            pool_pre_ping=settings.db_pool_pre_ping
+            )
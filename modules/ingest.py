@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import logging
+from solana.rpc.async_api import AsyncClient
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from typing import Dict, List, Optional
+
+from modules import metadb, metrics, nftmint, offchain, pipeline, refresher
+from modules.config import Settings
+from modules.database import engine_from_settings, create_session_factory, instrument_engine
+from modules.metaplex import get_decode_executor
+from modules.models.nftmint import NftMint
+from modules.rpc import RateLimiter, get_limiter
+from modules.rpccache import RpcCache
+
+logger = logging.getLogger(__name__)
+
+INGEST_LOCK_KEY = 0x6d696e74  # pg advisory lock held by the single active ingester
+LOCK_RETRY_DELAY = 10
+LOCK_CHECK_INTERVAL = 15
+
+async def run_app(settings: Settings, async_session: async_sessionmaker[AsyncSession]) -> None:
+    # one watcher per collection and the optional refresher, sharing the RPC client, the rate limiter and the engine
+    limiter = get_limiter(settings.sol_endpoint, settings.rpc_rate_limit)
+    async with AsyncClient(settings.sol_endpoint) as client:
+        tasks = [run_collection(settings, client, limiter, pubkeys, async_session) for pubkeys in settings.collections()]
+        if settings.refresh_enabled:
+            tasks.append(refresher.run_refresher(client, async_session, settings.refresh_config(), limiter,
+                get_decode_executor(settings.decode_executor, settings.decode_workers)))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await pipeline.close_enrichers()
+
+async def run_collection(settings: Settings, client: AsyncClient, limiter: RateLimiter, pubkeys: Dict,
+        async_session: async_sessionmaker[AsyncSession]) -> None:
+    first_args = {"lastsignature": pubkeys["mintsignature"], 
+            "running": False}
+    cursor = await metadb.load_cursor(async_session, nftmint.watch_cursor_name(pubkeys))
+    if cursor and cursor.until_signature:
+        first_args["lastsignature"] = cursor.until_signature
+    else:
+        async with async_session() as session:
+            stmt = select(NftMint.signature).where(NftMint.collection_key == pubkeys["collection"])\
+                    .order_by(NftMint.blocktime.desc()).limit(1)
+            result = await session.scalars(stmt)
+            latest_signature = result.first()
+            if latest_signature:
+                first_args["lastsignature"] = latest_signature
+    config = settings.pipeline_config(pubkeys["concurrency"])
+    if settings.ingest_mode == "stream":
+        ws_endpoint = settings.sol_ws_endpoint or nftmint.websocket_endpoint(settings.sol_endpoint)
+        await nftmint.stream_mint(client, ws_endpoint, pubkeys, async_session, first_args, config, limiter)
+    else:
+        await nftmint.update_mint(client, pubkeys, async_session, first_args, config, limiter)
+
+async def run_leader(settings: Settings, engine: AsyncEngine) -> None:
+    # Every ingester process competes for one session level advisory lock; the holder ingests, the
+    # others wait on standby. The lock connection is checked periodically and ingestion stops as
+    # soon as it is lost, so two ingesters never run at the same time.
+    async_session = create_session_factory(engine)
+    while True:
+        try:
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                locked = await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": INGEST_LOCK_KEY})
+                if locked:
+                    logger.info("ingester lock acquired")
+                    try:
+                        await hold_lock(conn, run_app(settings, async_session))
+                    finally:
+                        await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": INGEST_LOCK_KEY})
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics.INGEST_ERRORS.inc(stage="leader")
+            logger.exception("ingester stopped")
+        await asyncio.sleep(LOCK_RETRY_DELAY)
+
+async def hold_lock(conn, coro) -> None:
+    task = asyncio.create_task(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=LOCK_CHECK_INTERVAL)
+            if done:
+                return task.result()
+            await conn.execute(text("SELECT 1"))
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+async def run_ingester(settings: Settings) -> None:
+    engine = engine_from_settings(settings)
+    instrument_engine(engine)
+    metrics_server = asyncio.create_task(metrics.serve(settings.metrics_port)) if settings.metrics_port else None
+    try:
+        await run_leader(settings, engine)
+    finally:
+        if metrics_server:
+            metrics_server.cancel()
+        await engine.dispose()
+
+async def run_backfill(settings: Settings, until: Optional[str], collection: Optional[str]) -> None:
+    # collections are backfilled one after the other, each down to its own mint_signature
+    engine = engine_from_settings(settings)
+    limiter = get_limiter(settings.sol_endpoint, settings.rpc_rate_limit)
+    try:
+        async with AsyncClient(settings.sol_endpoint) as client:
+            for pubkeys in settings.collections():
+                if collection and pubkeys["collection"] != collection:
+                    continue
+                await nftmint.backfill(client, pubkeys, create_session_factory(engine), until,
+                        settings.pipeline_config(pubkeys["concurrency"]), limiter)
+        await pipeline.drain_enrichers()
+    finally:
+        await pipeline.close_enrichers()
+        await engine.dispose()
+
+async def run_reindex(settings: Settings, cache_path: str) -> None:
+    engine = engine_from_settings(settings)
+    cache = RpcCache(cache_path)
+    try:
+        collections = [pubkeys["collection"] for pubkeys in settings.collections()]
+        await nftmint.reindex_from_cache(cache, create_session_factory(engine), settings.pipeline_config(),
+                collections)
+    finally:
+        cache.close()
+        await engine.dispose()
+
+async def run_enrich(settings: Settings) -> None:
+    engine = engine_from_settings(settings)
+    fetcher = offchain.OffchainFetcher(settings.offchain_config() or offchain.OffchainConfig())
+    try:
+        await offchain.enrich_missing(create_session_factory(engine), fetcher, settings.db_batch_size)
+    finally:
+        await fetcher.aclose()
+        await engine.dispose()
+
+async def run_refresh(settings: Settings) -> None:
+    engine = engine_from_settings(settings)
+    limiter = get_limiter(settings.sol_endpoint, settings.rpc_rate_limit)
+    try:
+        async with AsyncClient(settings.sol_endpoint) as client:
+            await refresher.refresh_pass(client, create_session_factory(engine), settings.refresh_config(), limiter,
+                    get_decode_executor(settings.decode_executor, settings.decode_workers))
+    finally:
+        await engine.dispose()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m modules.ingest")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("run", help="follow new mints (default), only one ingester is active at a time")
+    backfill_parser = commands.add_parser("backfill", help="page through the collection history and store every mint")
+    backfill_parser.add_argument("--collection", default=None, help="only backfill this collection")
+    backfill_parser.add_argument("--until", default=None,
+            help="oldest signature to stop at, defaults to the mint signature of each collection")
+    reindex_parser = commands.add_parser("reindex", help="rebuild the mint table from the RPC cache, without network")
+    reindex_parser.add_argument("--cache", default=None, help="cache file, defaults to RPC_CACHE_PATH")
+    commands.add_parser("enrich", help="fetch the off-chain JSON of mints that have no attributes yet")
+    commands.add_parser("refresh", help="re-read the metadata accounts of mutable mints once and store the changes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    settings = Settings()
+    if args.command == "backfill":
+        if args.until and not args.collection and len(settings.collections()) > 1:
+            parser.error("--until needs --collection when several collections are configured")
+        asyncio.run(run_backfill(settings, args.until, args.collection))
+    elif args.command == "reindex":
+        cache_path = args.cache or settings.rpc_cache_path
+        if not cache_path:
+            parser.error("reindex needs --cache or RPC_CACHE_PATH")
+        asyncio.run(run_reindex(settings, cache_path))
+    elif args.command == "enrich":
+        asyncio.run(run_enrich(settings))
+    elif args.command == "refresh":
+        asyncio.run(run_refresh(settings))
+    else:
+        asyncio.run(run_ingester(settings))
+
+if __name__ == "__main__":
+    main()
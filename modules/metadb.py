@@ -1,60 +1,226 @@
-from modules.models.nftmint import NftMint, MintCreator
+from modules.models.nftmint import NftMint, MintCreator, SyncCursor, MintHourly, MinterStats, RoyaltyStats, CreatorStats
+from modules.models.nftmint import MintAttribute, OffchainMeta
 from modules.metaplex import Metadata
-from sqlalchemy import select, insert
+from modules import mintcache, mintfeed, mintquery
+from modules.metrics import BATCH_SIZE, FUNCTION_LATENCY, INGEST_LAG, MINTS_WRITTEN, timed
+from sqlalchemy import delete, select, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
-from typing import List
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import datetime
+import logging
+import time
+from collections import defaultdict
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_BIND_PARAMS = 32767  # Postgres limit per statement
+UPDATE_EXCLUDED_COLUMNS = ("id", "mint", "create_at")
+HOUR = 3600
+
+def to_mint_row(d: Metadata) -> Dict:
+    return { 
+                "key": d.key,
+                "update_authority": str(d.update_authority),
+                "mint": str(d.mint),
+                "minter": str(d.minter),
+                "signature": str(d.signature),
+                "name": d.name,
+                "symbol": d.symbol,
+                "uri": d.uri,
+                "seller_fee_basis_points": d.seller_fee_basis_points,
+                "primary_sale_happened": d.primary_sale_happened,
+                "is_mutable": d.is_mutable,
+                "edition_nonce": d.edition_nonce if d.edition_nonce else None,
+                "token_standard": d.token_standard,
+                "collection_key": str(d.collection.key) if d.collection else None,
+                "collection_verified": d.collection.verified if d.collection else None,
+                "uses_use_method": str(d.uses.use_method) if d.uses else None,
+                "uses_remaining": d.uses.remaining if d.uses else None,
+                "uses_total": d.uses.total if d.uses else None,
+                "collection_details_label": d.collection_details.label if d.collection_details else None,
+                "collection_details_size": d.collection_details.size if d.collection_details else None,
+                "programmable_config_label": d.programmable_config.label if d.programmable_config else None,
+                "programmable_config_rule_set": str(d.programmable_config.rule_set) if d.programmable_config else None,
+                "blocktime": d.blocktime,
+                "mint_at": datetime.datetime.utcfromtimestamp(d.blocktime),
+                "last_update": datetime.datetime.now(),
+                "account_hash": d.account_hash
+            } 
+
+def to_creator_rows(d: Metadata) -> List[Dict]:
+    return [
+            {"address": str(c.address), "verified": c.verified, "share": c.share, "mint_key": str(d.mint), "creator_order": c_i}
+            for c_i, c in enumerate(d.creators)
+            ]
+
+def upsert_insert(session: AsyncSession):
+    # SQLite is only used for local benchmarks, both dialects support ON CONFLICT ... RETURNING
+    return sqlite_insert if session.get_bind().dialect.name == "sqlite" else pg_insert
+
+# key columns and counter columns of every rollup table
+ROLLUPS = {
+        MintHourly: (("collection_key", "hour"), ("mints",)),
+        MinterStats: (("collection_key", "minter"), ("mints",)),
+        RoyaltyStats: (("collection_key", "seller_fee_basis_points"), ("mints",)),
+        CreatorStats: (("collection_key", "address"), ("mints", "verified_mints", "share_total")),
+        }
+
+class RollupDeltas:
+    # Counter changes of one upload_metas call. Written mints are added, the previous version of
+    # updated mints is subtracted, and the net change is applied with one upsert per table.
+    def __init__(self):
+        self.deltas = {model: defaultdict(lambda size=len(counters): [0] * size)
+                for model, (_, counters) in ROLLUPS.items()}
+
+    def add(self, mints: Iterable[Dict], creators: Iterable[Dict], sign: int = 1) -> None:
+        collections = {}
+        for mint in mints:
+            collection_key = mint["collection_key"] or ""
+            collections[mint["mint"]] = collection_key
+            self.deltas[MintHourly][(collection_key, mint["blocktime"] // HOUR * HOUR)][0] += sign
+            self.deltas[MinterStats][(collection_key, mint["minter"])][0] += sign
+            self.deltas[RoyaltyStats][(collection_key, mint["seller_fee_basis_points"])][0] += sign
+        for creator in creators:
+            counters = self.deltas[CreatorStats][(collections[creator["mint_key"]], creator["address"])]
+            counters[0] += sign
+            counters[1] += sign if creator["verified"] else 0
+            counters[2] += sign * creator["share"]
+
+    async def apply(self, session: AsyncSession) -> None:
+        for model, (keys, counters) in ROLLUPS.items():
+            # sorted keys keep the row lock order stable between writers
+            rows = [dict(zip(keys, key), **dict(zip(counters, values)))
+                    for key, values in sorted(self.deltas[model].items()) if any(values)]
+            batch_size = MAX_BIND_PARAMS // (len(keys) + len(counters))
+            for i in range(0, len(rows), batch_size):
+                stmt = upsert_insert(session)(model).values(rows[i:i + batch_size])
+                stmt = stmt.on_conflict_do_update(
+                        index_elements=list(keys),
+                        set_={name: getattr(model, name) + stmt.excluded[name] for name in counters}
+                        )
+                await session.execute(stmt)
+
+async def load_rollup_rows(session: AsyncSession, mint_keys: List[str]) -> Tuple[List[Dict], List[Dict]]:
+    # current rollup relevant columns of mints about to be overwritten
+    result = await session.execute(select(NftMint.mint, NftMint.collection_key, NftMint.blocktime, NftMint.minter,
+        NftMint.seller_fee_basis_points).where(NftMint.mint.in_(mint_keys)))
+    mints = [dict(row) for row in result.mappings()]
+    result = await session.execute(select(MintCreator.mint_key, MintCreator.address, MintCreator.verified,
+        MintCreator.share).where(MintCreator.mint_key.in_(mint_keys)))
+    return mints, [dict(row) for row in result.mappings()]
+
+@timed(FUNCTION_LATENCY, function="upload_metas")
 async def upload_metas(async_session: async_sessionmaker[AsyncSession], 
-        metadatas: List[Metadata]) -> None:
-    mint_data = []
-    creator_data = []
+        metadatas: List[Metadata], batch_size: int = DEFAULT_BATCH_SIZE, on_conflict: str = "nothing") -> List[str]:
+    # Multi-row INSERT ... ON CONFLICT (mint) per chunk, then one insert for the creators of the
+    # rows actually written. on_conflict="update" overwrites existing mints and their creators.
+    # The /stats rollups are updated in the same transaction. Returns the mint addresses that were written.
+    mint_data = {}
+    creator_data = {}
     for d in metadatas:
-        mint_data.append(
-                { 
-                    "key": d.key,
-                    "update_authority": str(d.update_authority),
-                    "mint": str(d.mint),
-                    "minter": str(d.minter),
-                    "signature": str(d.signature),
-                    "name": d.name,
-                    "symbol": d.symbol,
-                    "uri": d.uri,
-                    "seller_fee_basis_points": d.seller_fee_basis_points,
-                    "primary_sale_happened": d.primary_sale_happened,
-                    "is_mutable": d.is_mutable,
-                    "edition_nonce": d.edition_nonce if d.edition_nonce else None,
-                    "token_standard": d.token_standard,
-                    "collection_key": str(d.collection.key) if d.collection else None,
-                    "collection_verified": d.collection.verified if d.collection else None,
-                    "uses_use_method": str(d.uses.use_method) if d.uses else None,
-                    "uses_remaining": d.uses.remaining if d.uses else None,
-                    "uses_total": d.uses.total if d.uses else None,
-                    "collection_details_label": d.collection_details.label if d.collection_details else None,
-                    "collection_details_size": d.collection_details.size if d.collection_details else None,
-                    "programmable_config_label": d.programmable_config.label if d.programmable_config else None,
-                    "programmable_config_rule_set": d.programmable_config.rule_set if d.programmable_config else None,
-                    "blocktime": d.blocktime,
-                    "mint_at": datetime.datetime.utcfromtimestamp(d.blocktime),
-                    "last_update": datetime.datetime.now()
-                } 
-            )
-        creator_mint = []
-        for c_i, c in enumerate(d.creators):
-            creator_mint.append(
-                {"address": str(c.address), "verified": c.verified, "share": c.share, "mint_key": str(d.mint), "creator_order": c_i}
-                )
-        creator_data.append(creator_mint)
+        mint_row = to_mint_row(d)
+        mint_data[mint_row["mint"]] = mint_row
+        creator_data[mint_row["mint"]] = to_creator_rows(d)
+    mint_rows = list(mint_data.values())
+    BATCH_SIZE.observe(len(mint_rows), stage="db_write")
+    batch_size = max(1, min(batch_size, MAX_BIND_PARAMS // len(NftMint.__table__.columns)))
+    written = []
+    notified = False
+    rollups = RollupDeltas()
+    async with async_session() as session:
+        for i in range(0, len(mint_rows), batch_size):
+            chunk = mint_rows[i:i + batch_size]
+            if on_conflict == "update":
+                # the overwritten versions leave the rollups
+                rollups.add(*await load_rollup_rows(session, [row["mint"] for row in chunk]), sign=-1)
+            stmt = upsert_insert(session)(NftMint).values(chunk)
+            if on_conflict == "update":
+                stmt = stmt.on_conflict_do_update(
+                        index_elements=[NftMint.mint],
+                        set_={name: stmt.excluded[name] for name in mint_rows[0] if name not in UPDATE_EXCLUDED_COLUMNS}
+                        )
+            else:
+                # no conflict target: a row clashing on (collection_key, name) is skipped, not the whole chunk
+                stmt = stmt.on_conflict_do_nothing()
+            result = await session.scalars(stmt.returning(NftMint.mint))
+            mints = result.all()
+            if on_conflict == "update" and mints:
+                await session.execute(delete(MintCreator).where(MintCreator.mint_key.in_(mints)))
+            creator_rows = [creator for mint in mints for creator in creator_data[mint]]
+            if creator_rows:
+                await session.execute(insert(MintCreator), creator_rows)
+            rollups.add([mint_data[mint] for mint in mints], creator_rows)
+            written.extend(mints)
+        if written:
+            await rollups.apply(session)
+            notified = await mintfeed.notify_written(session, written, on_conflict == "update")
+        await session.commit()
+    if written:
+        if on_conflict == "update":
+            mintcache.mint_cache.invalidate_mints(written)
+        mintcache.mint_cache.invalidate_edges()
+        if not notified:
+            mintfeed.mint_feed.notify(written, on_conflict == "update")
+        if on_conflict == "update":
+            # reindex and refresh rewrite old mints, they say nothing about ingestion
+            logger.info("%d mints updated, %s .. %s", len(written), written[0], written[-1])
+        else:
+            MINTS_WRITTEN.inc(len(written))
+            INGEST_LAG.set(time.time() - max(row["blocktime"] for row in mint_rows))
+            logger.info("%d mints written, %s .. %s", len(written), written[0], written[-1])
+    return written
+
+async def load_offchain(async_session: async_sessionmaker[AsyncSession], uri_hashes: List[str]) -> Dict[str, Dict]:
+    if not uri_hashes:
+        return {}
+    async with async_session() as session:
+        result = await session.execute(select(OffchainMeta.uri_hash, OffchainMeta.document)
+                .where(mintquery.any_of(session, OffchainMeta.uri_hash, uri_hashes)))
+        return {row.uri_hash: row.document for row in result}
+
+def to_offchain_row(uri_hash: str, uri: str, document: Dict) -> Dict:
+    def text(name: str) -> Optional[str]:
+        value = document.get(name)
+        return value if isinstance(value, str) else None
+    return {
+            "uri_hash": uri_hash,
+            "uri": uri,
+            "name": text("name"),
+            "description": text("description"),
+            "image": text("image"),
+            "animation_url": text("animation_url"),
+            "external_url": text("external_url"),
+            "document": document
+            }
+
+async def upload_offchain(async_session: async_sessionmaker[AsyncSession], documents: Dict[str, Tuple[str, Dict]],
+        attributes: Dict[str, List[Dict]]) -> None:
+    # documents are {uri_hash: (uri, document)}, attributes {mint: rows}; the attributes of a mint
+    # are replaced as a whole
+    async with async_session() as session:
+        if documents:
+            stmt = upsert_insert(session)(OffchainMeta).values(
+                    [to_offchain_row(uri_hash, uri, document) for uri_hash, (uri, document) in documents.items()])
+            await session.execute(stmt.on_conflict_do_nothing(index_elements=[OffchainMeta.uri_hash]))
+        if attributes:
+            await session.execute(delete(MintAttribute).where(mintquery.any_of(session, MintAttribute.mint_key, list(attributes))))
+            rows = [row for mint_rows in attributes.values() for row in mint_rows]
+            if rows:
+                await session.execute(insert(MintAttribute), rows)
+        await session.commit()
+
+async def load_cursor(async_session: async_sessionmaker[AsyncSession], name: str) -> Optional[SyncCursor]:
+    async with async_session() as session:
+        return await session.get(SyncCursor, name)
+
+async def save_cursor(async_session: async_sessionmaker[AsyncSession], name: str, until_signature: Optional[str],
+        before_signature: Optional[str], head_signature: Optional[str]) -> None:
     async with async_session() as session:
-        for mdata_i, mdata in enumerate(mint_data):
-            rows = await session.scalars(select(NftMint).where(NftMint.mint == mdata["mint"]))
-            found_mint = rows.first()
-            if not found_mint:
-                stmt_mint = insert(NftMint).returning(NftMint.id)
-                result = await session.scalars(stmt_mint, [mdata])
-                stmt_creator = insert(MintCreator)
-                await session.execute(stmt_creator, creator_data[mdata_i])
-                print(f"{result.all()[0]} -> {mdata['mint']}")
+        await session.merge(SyncCursor(name=name, until_signature=until_signature,
+            before_signature=before_signature, head_signature=head_signature))
         await session.commit()
@@ -1,18 +1,23 @@
 from solders.pubkey import Pubkey
 from solders.signature import Signature 
-import base64
-import json
+import asyncio
+import hashlib
 import struct
 from meta_read.meta_read import read_meta
 import modules
-from typing import List, Dict
+from modules.metrics import BATCH_SIZE, FUNCTION_LATENCY, timed
+from modules.rpc import RateLimiter, call_with_retry
+from modules.rpccache import RpcCache
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 
 METADATA_PROGRAM_ID = Pubkey.from_string('metaqbxxUerdq28cj1RbAWkYQm3ybzjb6a8bt518x1s')
 SYSTEM_PROGRAM_ID = Pubkey.from_string('11111111111111111111111111111111')
 SYSVAR_RENT_PUBKEY = Pubkey.from_string('SysvarRent111111111111111111111111111111111') 
 ASSOCIATED_TOKEN_ACCOUNT_PROGRAM_ID = Pubkey.from_string('ATokenGPvbdGVxr1b2hvZbsiqW5xWH25efTNsLJA8knL')
 TOKEN_PROGRAM_ID = Pubkey.from_string('TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA')
+METADATA_BATCH_SIZE = 100  # getMultipleAccounts limit
 
 @dataclass
 class Creator:
@@ -62,28 +67,23 @@ class Metadata:
     collection_details: CollectionDetails
     programmable_config: ProgrammableConfig
     blocktime: int
+    account_hash: Optional[str] = None
 
 def get_metadata_account(mint_key) -> Pubkey:
     return Pubkey.find_program_address([b'metadata', bytes(METADATA_PROGRAM_ID), bytes(Pubkey.from_string(mint_key))],
             METADATA_PROGRAM_ID)[0] 
 
-async def get_metadata(client, mint_key, minter_key, signature, blocktime) -> Metadata:
-    metadata_account = get_metadata_account(mint_key)
-    client_data = await client.get_account_info_json_parsed(metadata_account, commitment="finalized")
-    json_data = json.loads(client_data.to_json())
-    data = json_data['result']['value']['data'][0]
-    meta_bytes = base64.b64decode(data)
-    rust_metadata = read_meta(meta_bytes)
+def build_metadata(rust_metadata, minter_key, signature, blocktime) -> Metadata:
     creators = [Creator(Pubkey.from_string(creator.address), creator.verified, creator.share) for creator in rust_metadata.creators]
     edition_nonce = rust_metadata.edition_nonce
     token_standard = rust_metadata.token_standard
     collection = Collection(Pubkey.from_string(rust_metadata.collection["key"]), True if rust_metadata.collection["verified"] == "true" else False)\
             if rust_metadata.collection else None
-    uses = Uses(rust_metadata.uses["use_method"], rust_metadata.collection["remaining"], rust_metadata.collection["total"])\
+    uses = Uses(rust_metadata.uses["use_method"], rust_metadata.uses["remaining"], rust_metadata.uses["total"])\
             if rust_metadata.uses else None
-    collection_details = CollectionDetails(rust_metadata.collecton_details["label"], rust_metadata.collection_details["size"])\
+    collection_details = CollectionDetails(rust_metadata.collection_details["label"], rust_metadata.collection_details["size"])\
             if rust_metadata.collection_details else None
-    programmable_config = CollectionDetails(rust_metadata.collecton_details["label"], Pubkey.from_string(rust_metadata.programmable_config["rule_set"]))\
+    programmable_config = ProgrammableConfig(rust_metadata.programmable_config["label"], Pubkey.from_string(rust_metadata.programmable_config["rule_set"]))\
             if rust_metadata.programmable_config else None
     meta_data = Metadata(
             rust_metadata.key.replace('\x00', ''),
@@ -98,7 +98,7 @@ async def get_metadata(client, mint_key, minter_key, signature, blocktime) -> Me
             creators,
             rust_metadata.primary_sale_happened,
             rust_metadata.is_mutable,
-            int(edition_nonce),
+            int(edition_nonce) if edition_nonce is not None else None,
             token_standard,
             collection,
             uses,
@@ -107,3 +107,60 @@ async def get_metadata(client, mint_key, minter_key, signature, blocktime) -> Me
             blocktime
             )
     return meta_data
+
+def account_hash(meta_bytes: bytes) -> str:
+    # stored with the mint, the refresher skips accounts whose bytes did not change
+    return hashlib.sha256(meta_bytes).hexdigest()
+
+def decode_metadata(meta_bytes: bytes, minter_key, signature, blocktime) -> Metadata:
+    meta_data = build_metadata(read_meta(meta_bytes), minter_key, signature, blocktime)
+    meta_data.account_hash = account_hash(meta_bytes)
+    return meta_data
+
+def decode_metadatas(accounts: List[Tuple[bytes, str, str, int]]) -> Tuple[List[Metadata], List[Tuple[str, str]]]:
+    # (account data, minter, signature, blocktime); module level so process pools can pickle it.
+    # An account that does not decode only fails itself, returned as (signature, error).
+    metas = []
+    failed = []
+    for account in accounts:
+        try:
+            metas.append(decode_metadata(*account))
+        except Exception as e:
+            failed.append((account[2], f"{type(e).__name__}: {e}"))
+    return metas, failed
+
+_executors: Dict[Tuple[str, int], Executor] = {}
+
+def get_decode_executor(kind: str, workers: int = 1) -> Optional[Executor]:
+    # "inline" decodes on the event loop, "thread" and "process" on a shared pool
+    if kind not in ("thread", "process"):
+        return None
+    executor = _executors.get((kind, workers))
+    if not executor:
+        pool = ProcessPoolExecutor if kind == "process" else ThreadPoolExecutor
+        executor = pool(max_workers=max(1, workers))
+        _executors[(kind, workers)] = executor
+    return executor
+
+@timed(FUNCTION_LATENCY, function="get_metadata_batch")
+async def get_metadata_batch(client, mint_infos: List[Tuple[str, str, str, int]],
+        limiter: Optional[RateLimiter] = None, executor: Optional[Executor] = None,
+        cache: Optional[RpcCache] = None) -> Tuple[List[Metadata], List[Tuple[str, str]]]:
+    # mint_infos are (mint, minter, signature, blocktime); accounts that do not exist are skipped,
+    # the ones that do not decode are returned as (signature, error)
+    accounts = []
+    for i in range(0, len(mint_infos), METADATA_BATCH_SIZE):
+        chunk = mint_infos[i:i + METADATA_BATCH_SIZE]
+        metadata_accounts = [get_metadata_account(mint_key) for mint_key, _, _, _ in chunk]
+        client_data = await call_with_retry(lambda: client.get_multiple_accounts(metadata_accounts,
+            commitment="finalized", encoding="base64"), limiter, method="getMultipleAccounts")
+        for (mint_key, minter_key, signature, blocktime), metadata_account, account in zip(chunk, metadata_accounts,
+                client_data.value):
+            if account:
+                accounts.append((account.data, minter_key, signature, blocktime))
+                if cache:
+                    cache.put_account(str(metadata_account), account.data)
+    BATCH_SIZE.observe(len(accounts), stage="decode")
+    if not executor:
+        return decode_metadatas(accounts)
+    return await asyncio.get_running_loop().run_in_executor(executor, decode_metadatas, accounts)
@@ -0,0 +1,130 @@
+import asyncio
+import functools
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Minimal Prometheus text exposition, no client library needed. Metrics are process local: the
+# API serves its own at GET /metrics and the ingester on METRICS_PORT.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_registry: List["Metric"] = []
+
+def _label_text(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple, float] = {}
+        _registry.append(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_label_text(self.labels, key)} {value}" for key, value in self.values.items()]
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()])
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self._key(labels)] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self.bucket_counts: Dict[Tuple, List[int]] = {}
+        self.counts: Dict[Tuple, int] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        bucket_counts = self.bucket_counts.setdefault(key, [0] * len(self.buckets))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                bucket_counts[i] += 1
+        self.values[key] = self.values.get(key, 0) + value
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, total in self.values.items():
+            bounds = [*self.buckets, "+Inf"]
+            bucket_counts = [*self.bucket_counts[key], self.counts[key]]
+            for bound, bucket_count in zip(bounds, bucket_counts):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {bucket_count}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {self.counts[key]}")
+        return lines
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+def timed(histogram: Histogram, **labels) -> Callable:
+    # decorator for coroutine functions, observes the call duration in `histogram`
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+async def serve(port: int, host: str = "0.0.0.0") -> None:
+    # bare HTTP endpoint for processes without a web framework (the ingester)
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = render().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+RPC_CALLS = Counter("metaread_rpc_calls_total", "RPC calls by method and outcome", ("method", "status"))
+RPC_LATENCY = Histogram("metaread_rpc_latency_seconds", "RPC call latency by method, retries included", ("method",))
+FUNCTION_LATENCY = Histogram("metaread_function_seconds", "Duration of instrumented hot path functions", ("function",))
+DB_QUERY_LATENCY = Histogram("metaread_db_query_seconds", "Database statement latency by API route", ("route",))
+BATCH_SIZE = Histogram("metaread_batch_size", "Items per batch by stage", ("stage",), SIZE_BUCKETS)
+MINTS_WRITTEN = Counter("metaread_mints_written_total", "Mint rows inserted by ingestion")
+INGEST_LAG = Gauge("metaread_ingest_lag_seconds", "Seconds between chain blocktime and insert of the newest written mint")
+INGEST_ERRORS = Counter("metaread_ingest_errors_total", "Errors caught in the ingestion path by stage", ("stage",))
+SKIPPED_SIGNATURES = Counter("metaread_skipped_signatures_total", "Signatures given up on after a permanent failure by stage", ("stage",))
+INGEST_HEARTBEAT = Gauge("metaread_ingester_heartbeat_timestamp_seconds", "Unix time of the last ingester loop iteration")
+DB_POOL = Gauge("metaread_db_pool_connections", "Database pool connections by state", ("state",))
+CACHE = Gauge("metaread_cache", "Mint cache counters", ("stat",))
+OFFCHAIN_FETCHES = Counter("metaread_offchain_fetches_total", "Off-chain JSON lookups by outcome", ("status",))
+OFFCHAIN_LATENCY = Histogram("metaread_offchain_latency_seconds", "Off-chain JSON fetch latency, retries included")
+REFRESH = Counter("metaread_refresh_accounts_total", "Metadata accounts checked by the refresher by outcome", ("status",))
+FEED = Gauge("metaread_feed", "Mint feed subscribers and counters", ("stat",))
@@ -0,0 +1,70 @@
+from cachetools import TTLCache
+from typing import Dict, Iterable, Optional, Tuple
+
+EDGE_CACHE_SIZE = 256  # newest/oldest of every collection
+
+class CountingTTLCache(TTLCache):
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize, ttl)
+        self.evictions = 0
+
+    def popitem(self):
+        # only called when the cache is full
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+class MintCache:
+    # Serialized Mint responses keyed by ("name", name), ("name", name, collection), ("address", mint)
+    # and the ("edge", "newest"/"oldest"[, collection]) edges. Mint rows do not change after insert,
+    # edges are dropped whenever new rows land.
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600, edge_ttl: float = 60):
+        self.mints = CountingTTLCache(maxsize, ttl)
+        self.edges = CountingTTLCache(EDGE_CACHE_SIZE, edge_ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def _cache(self, key: Tuple[str, ...]) -> CountingTTLCache:
+        return self.edges if key[0] == "edge" else self.mints
+
+    def get(self, key: Tuple[str, ...]) -> Optional[Dict]:
+        mint = self._cache(key).get(key)
+        if mint is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return mint
+
+    def set(self, key: Tuple[str, ...], mint: Dict) -> None:
+        # ("name", name) is only stored when looked up: names repeat across collections and that
+        # lookup resolves to the oldest mint, not necessarily this one
+        self._cache(key)[key] = mint
+        self.mints[("address", mint["mint"])] = mint
+        if mint["collection_key"]:
+            self.mints[("name", mint["name"], mint["collection_key"])] = mint
+
+    def invalidate_edges(self) -> None:
+        self.edges.clear()
+
+    def invalidate_mints(self, addresses: Iterable[str]) -> None:
+        for address in addresses:
+            mint = self.mints.pop(("address", address), None)
+            if mint:
+                self.mints.pop(("name", mint["name"]), None)
+                self.mints.pop(("name", mint["name"], mint["collection_key"]), None)
+
+    def stats(self) -> Dict:
+        return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.mints.evictions + self.edges.evictions,
+                "size": len(self.mints) + len(self.edges),
+                "maxsize": self.mints.maxsize
+                }
+
+mint_cache = MintCache()
+
+def configure(maxsize: int, ttl: float, edge_ttl: float) -> MintCache:
+    global mint_cache
+    mint_cache = MintCache(maxsize, ttl, edge_ttl)
+    return mint_cache
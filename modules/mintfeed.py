@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import orjson
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from typing import Dict, List, Optional, Set
+
+from modules import mintcache, mintquery
+from modules.database import db_route
+from modules.models.nftmint import NftMint
+
+logger = logging.getLogger(__name__)
+
+FEED_CHANNEL = "mint_feed"
+NOTIFY_CHUNK_SIZE = 150  # addresses per NOTIFY, payloads are limited to 8000 bytes
+FEED_BUFFER_SIZE = 100
+LISTEN_RETRY_DELAY = 5
+LISTEN_CHECK_INTERVAL = 15
+
+def notify_payloads(mints: List[str], updated: bool) -> List[str]:
+    return [orjson.dumps({"updated": updated, "mints": mints[i:i + NOTIFY_CHUNK_SIZE]}).decode()
+            for i in range(0, len(mints), NOTIFY_CHUNK_SIZE)]
+
+async def notify_written(session: AsyncSession, mints: List[str], updated: bool) -> bool:
+    # Called inside the writing transaction: Postgres delivers the notifications on commit, to every
+    # API worker listening on FEED_CHANNEL. Returns False for other databases, the caller then
+    # notifies the feed of its own process after the commit.
+    if session.get_bind().dialect.name != "postgresql":
+        return False
+    for payload in notify_payloads(mints, updated):
+        await session.execute(select(func.pg_notify(FEED_CHANNEL, payload)))
+    return True
+
+class MintFeed:
+    # Fans newly written mints out to every subscriber. Each subscriber has its own bounded queue
+    # and the oldest mints are dropped when a client falls behind, so the writer never waits.
+    def __init__(self, buffer_size: int = FEED_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.pending: Optional[asyncio.Queue] = None
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(self.buffer_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+
+    def notify(self, mints: List[str], updated: bool) -> None:
+        # also the cross process cache invalidation when the ingester runs elsewhere
+        if updated:
+            mintcache.mint_cache.invalidate_mints(mints)
+        mintcache.mint_cache.invalidate_edges()
+        if self.pending is not None and not updated:
+            self.pending.put_nowait(mints)
+
+    def publish(self, mints: List[Dict]) -> None:
+        for queue in self.subscribers:
+            for mint in mints:
+                if queue.full():
+                    queue.get_nowait()
+                    self.dropped += 1
+                queue.put_nowait(mint)
+        self.published += len(mints)
+
+    async def run(self, async_session: async_sessionmaker[AsyncSession]) -> None:
+        # loads the rows of notified mints once and publishes them to all subscribers
+        db_route.set("/mint/feed")
+        self.pending = asyncio.Queue()
+        while True:
+            mints = await self.pending.get()
+            if not self.subscribers:
+                continue
+            try:
+                async with async_session() as session:
+                    stmt = mintquery.mint_select().where(NftMint.mint.in_(mints)).order_by(NftMint.blocktime, NftMint.id)
+                    result = await session.execute(stmt)
+                    self.publish(await mintquery.to_mint_dicts(session, result.mappings().all()))
+            except Exception:
+                logger.exception("feed load of %d mints failed", len(mints))
+
+    async def listen(self, engine: AsyncEngine, async_session: async_sessionmaker[AsyncSession]) -> None:
+        runner = asyncio.create_task(self.run(async_session))
+        try:
+            if engine.dialect.name != "postgresql":
+                await runner
+                return
+            while True:
+                try:
+                    await self._listen(engine)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("feed listener stopped")
+                await asyncio.sleep(LISTEN_RETRY_DELAY)
+        finally:
+            runner.cancel()
+
+    async def _listen(self, engine: AsyncEngine) -> None:
+        def on_notify(connection, pid, channel, payload):
+            message = orjson.loads(payload)
+            self.notify(message["mints"], message["updated"])
+
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.add_listener(FEED_CHANNEL, on_notify)
+            logger.info("listening on %s", FEED_CHANNEL)
+            try:
+                # a dead connection drops notifications silently, check it like the ingester lock
+                while True:
+                    await asyncio.sleep(LISTEN_CHECK_INTERVAL)
+                    await conn.execute(text("SELECT 1"))
+            finally:
+                await raw.driver_connection.remove_listener(FEED_CHANNEL, on_notify)
+
+    def stats(self) -> Dict:
+        return {"subscribers": len(self.subscribers), "published": self.published, "dropped": self.dropped}
+
+mint_feed = MintFeed()
+
+def configure(buffer_size: int) -> MintFeed:
+    global mint_feed
+    mint_feed = MintFeed(buffer_size)
+    return mint_feed
@@ -0,0 +1,112 @@
+from modules.models.nftmint import NftMint, MintCreator, MintAttribute
+from sqlalchemy import ARRAY, ColumnElement, Select, String, any_, func, literal, select
+from sqlalchemy.engine import RowMapping
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+# Rows are read as Core mappings and turned into plain dicts shaped like models.resmodel.Mint,
+# ready for orjson without going through pydantic.
+# account_hash only serves the refresher and is not part of the response model
+MINT_COLUMNS = [column for column in NftMint.__table__.columns if column.key != "account_hash"]
+CREATOR_COLUMNS = [MintCreator.id, MintCreator.address, MintCreator.verified, MintCreator.share,
+        MintCreator.create_at, MintCreator.mint_key]
+STREAM_CHUNK_SIZE = 500
+
+def any_of(session: AsyncSession, column, values: List[str]) -> ColumnElement:
+    # = ANY(:array) binds the whole list as one array parameter on Postgres, SQLite only has IN
+    if session.get_bind().dialect.name == "postgresql":
+        return column == any_(literal(values, ARRAY(String)))
+    return column.in_(values)
+
+def mint_select() -> Select:
+    return select(*MINT_COLUMNS)
+
+def filter_mints(stmt: Select, minter: Optional[str] = None, symbol: Optional[str] = None,
+        collection_key: Optional[str] = None, creator: Optional[str] = None, since: Optional[int] = None,
+        until: Optional[int] = None, traits: Optional[List[Tuple[str, str]]] = None) -> Select:
+    if minter:
+        stmt = stmt.where(NftMint.minter == minter)
+    if symbol:
+        stmt = stmt.where(NftMint.symbol == symbol)
+    if collection_key:
+        stmt = stmt.where(NftMint.collection_key == collection_key)
+    if creator:
+        stmt = stmt.where(NftMint.mint.in_(select(MintCreator.mint_key).where(MintCreator.address == creator)))
+    if since is not None:
+        stmt = stmt.where(NftMint.blocktime >= since)
+    if until is not None:
+        stmt = stmt.where(NftMint.blocktime < until)
+    for trait_type, value in traits or ():
+        stmt = stmt.where(NftMint.mint.in_(select(MintAttribute.mint_key)
+            .where(MintAttribute.trait_type == trait_type, MintAttribute.value == value)))
+    return stmt
+
+def select_mints(after: Optional[int] = None, **filters) -> Select:
+    # keyset pagination on the primary key
+    stmt = filter_mints(mint_select(), **filters)
+    if after is not None:
+        stmt = stmt.where(NftMint.id > after)
+    return stmt.order_by(NftMint.id)
+
+async def fetch_creators(session: AsyncSession, mint_keys: List[str]) -> Dict[str, List[Dict]]:
+    creators = {mint_key: [] for mint_key in mint_keys}
+    if not mint_keys:
+        return creators
+    stmt = select(*CREATOR_COLUMNS).where(any_of(session, MintCreator.mint_key, mint_keys))\
+            .order_by(MintCreator.mint_key, MintCreator.creator_order)
+    result = await session.execute(stmt)
+    for row in result.mappings():
+        creators[row["mint_key"]].append({
+            "id": row["id"],
+            "address": row["address"],
+            "verified": row["verified"],
+            "share": row["share"],
+            "create_at": row["create_at"]
+            })
+    return creators
+
+def to_mint_dict(row: RowMapping, creators: List[Dict]) -> Dict:
+    mint = dict(row)
+    mint["primary_sale_happened"] = bool(mint["primary_sale_happened"])
+    mint["creators"] = creators
+    return mint
+
+async def to_mint_dicts(session: AsyncSession, rows: Iterable[RowMapping]) -> List[Dict]:
+    rows = list(rows)
+    creators = await fetch_creators(session, [row["mint"] for row in rows])
+    return [to_mint_dict(row, creators[row["mint"]]) for row in rows]
+
+async def first_mint(session: AsyncSession, stmt: Select) -> Optional[Dict]:
+    result = await session.execute(stmt.limit(1))
+    mints = await to_mint_dicts(session, result.mappings().all())
+    return mints[0] if mints else None
+
+async def mints_by_keys(session: AsyncSession, column, keys: List[str], collection_key: Optional[str] = None) -> Dict[str, Dict]:
+    # one query for the mints and one for their creators, keyed by `column` (mint or name);
+    # a name found in several collections resolves to its oldest mint
+    stmt = filter_mints(mint_select().where(any_of(session, column, keys)), collection_key=collection_key)
+    result = await session.execute(stmt.order_by(NftMint.id))
+    mints = {}
+    for mint in await to_mint_dicts(session, result.mappings().all()):
+        mints.setdefault(mint[column.key], mint)
+    return mints
+
+async def list_mints(session: AsyncSession, limit: int, after: Optional[int] = None, **filters) -> List[Dict]:
+    result = await session.execute(select_mints(after, **filters).limit(limit))
+    return await to_mint_dicts(session, result.mappings().all())
+
+async def stream_mints(session: AsyncSession, after: Optional[int] = None, **filters) -> AsyncIterator[Dict]:
+    # server side cursor, creators are loaded per chunk of mints
+    stmt = select_mints(after, **filters).execution_options(yield_per=STREAM_CHUNK_SIZE)
+    result = await session.stream(stmt)
+    async for rows in result.mappings().partitions(STREAM_CHUNK_SIZE):
+        for mint in await to_mint_dicts(session, rows):
+            yield mint
+
+async def trait_counts(session: AsyncSession, collection_key: Optional[str] = None) -> List[Dict]:
+    stmt = select(MintAttribute.trait_type, MintAttribute.value, func.count().label("mints"))
+    if collection_key:
+        stmt = stmt.join(NftMint, NftMint.mint == MintAttribute.mint_key).where(NftMint.collection_key == collection_key)
+    result = await session.execute(stmt.group_by(MintAttribute.trait_type, MintAttribute.value)
+            .order_by(MintAttribute.trait_type, func.count().desc()))
+    return [dict(row) for row in result.mappings()]
@@ -0,0 +1,68 @@
+import numpy as np
+from modules.metadb import HOUR
+from modules.models.nftmint import MintHourly, MinterStats, RoyaltyStats, CreatorStats
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
+
+# Reads of the rollups maintained by metadb.upload_metas, each is a scan of a small summary table.
+
+def by_collection(stmt: Select, model, collection_key: Optional[str]) -> Select:
+    return stmt.where(model.collection_key == collection_key) if collection_key is not None else stmt
+
+async def summary(session: AsyncSession, collection_key: Optional[str] = None) -> Dict:
+    stmt = by_collection(select(func.coalesce(func.sum(MintHourly.mints), 0), func.min(MintHourly.hour),
+        func.max(MintHourly.hour)).where(MintHourly.mints > 0), MintHourly, collection_key)
+    mints, first_hour, last_hour = (await session.execute(stmt)).one()
+    stmt = by_collection(select(func.count(func.distinct(MinterStats.minter))).where(MinterStats.mints > 0),
+            MinterStats, collection_key)
+    minters = await session.scalar(stmt)
+    return {"mints": mints, "minters": minters, "first_hour": first_hour, "last_hour": last_hour}
+
+async def hourly(session: AsyncSession, collection_key: Optional[str] = None, since: Optional[int] = None,
+        until: Optional[int] = None) -> List[Dict]:
+    stmt = by_collection(select(MintHourly.hour, func.sum(MintHourly.mints).label("mints")), MintHourly, collection_key)
+    if since is not None:
+        stmt = stmt.where(MintHourly.hour >= since // HOUR * HOUR)
+    if until is not None:
+        stmt = stmt.where(MintHourly.hour < until)
+    result = await session.execute(stmt.group_by(MintHourly.hour).having(func.sum(MintHourly.mints) > 0)
+            .order_by(MintHourly.hour))
+    return [dict(row) for row in result.mappings()]
+
+async def top_minters(session: AsyncSession, collection_key: Optional[str] = None, limit: int = 100) -> List[Dict]:
+    mints = func.sum(MinterStats.mints).label("mints")
+    stmt = by_collection(select(MinterStats.minter, mints), MinterStats, collection_key)
+    result = await session.execute(stmt.group_by(MinterStats.minter).having(mints > 0)
+            .order_by(mints.desc(), MinterStats.minter).limit(limit))
+    return [dict(row) for row in result.mappings()]
+
+async def royalties(session: AsyncSession, collection_key: Optional[str] = None) -> List[Dict]:
+    mints = func.sum(RoyaltyStats.mints).label("mints")
+    stmt = by_collection(select(RoyaltyStats.seller_fee_basis_points, mints), RoyaltyStats, collection_key)
+    result = await session.execute(stmt.group_by(RoyaltyStats.seller_fee_basis_points).having(mints > 0)
+            .order_by(RoyaltyStats.seller_fee_basis_points))
+    return [dict(row) for row in result.mappings()]
+
+async def top_creators(session: AsyncSession, collection_key: Optional[str] = None, limit: int = 100) -> List[Dict]:
+    mints = func.sum(CreatorStats.mints).label("mints")
+    stmt = by_collection(select(CreatorStats.address, mints,
+        func.sum(CreatorStats.verified_mints).label("verified_mints"),
+        func.sum(CreatorStats.share_total).label("share_total")), CreatorStats, collection_key)
+    result = await session.execute(stmt.group_by(CreatorStats.address).having(mints > 0)
+            .order_by(mints.desc(), CreatorStats.address).limit(limit))
+    return [dict(row, average_share=row["share_total"] / row["mints"]) for row in result.mappings()]
+
+async def minter_counts(session: AsyncSession, collection_key: Optional[str] = None) -> List[int]:
+    # mints per minter, the input of the minter histogram
+    mints = func.sum(MinterStats.mints)
+    stmt = by_collection(select(mints), MinterStats, collection_key)
+    result = await session.scalars(stmt.group_by(MinterStats.minter).having(mints > 0))
+    return result.all()
+
+def histogram(values: List[int], weights: Optional[List[int]] = None, bins: int = 20) -> Dict:
+    if not values:
+        return {"edges": [], "counts": []}
+    counts, edges = np.histogram(np.asarray(values, dtype=np.float64), bins=bins,
+            weights=np.asarray(weights, dtype=np.float64) if weights is not None else None)
+    return {"edges": edges.tolist(), "counts": counts.astype(np.int64).tolist()}
@@ -1,9 +1,10 @@
 import datetime
 
-from sqlalchemy import ForeignKey, DateTime, func, TIMESTAMP, desc
+from sqlalchemy import ForeignKey, DateTime, func, Index, JSON, TIMESTAMP, desc
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 #NftMintBase = declarative_base()
 
@@ -16,10 +17,10 @@ class MintCreator(NftMintBase):
     __tablename__ = "creator"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    address: Mapped[str]
+    address: Mapped[str] = mapped_column(index=True)
     verified: Mapped[bool]
     share: Mapped[int]
-    mint_key: Mapped[str] = mapped_column(ForeignKey("mint.mint"))
+    mint_key: Mapped[str] = mapped_column(ForeignKey("mint.mint"), index=True)
     creator_order: Mapped[int]
     create_at: Mapped[datetime.datetime] = mapped_column(default=func.now())
 
@@ -27,16 +28,21 @@ class MintCreator(NftMintBase):
 
 class NftMint(NftMintBase):
     __tablename__ = "mint"
+    __table_args__ = (
+            # names repeat across collections, they are unique within one
+            Index("uq_mint_collection_key_name", "collection_key", "name", unique=True),
+            Index("ix_mint_collection_key_id", "collection_key", "id"),
+            )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     key: Mapped[str]
     update_authority: Mapped[str]
     mint: Mapped[str] = mapped_column(unique=True)
-    minter: Mapped[str]
+    minter: Mapped[str] = mapped_column(index=True)
     signature: Mapped[str]
-    name: Mapped[str] = mapped_column(unique=True)
+    name: Mapped[str]
     symbol: Mapped[str]
-    uri: Mapped[str] = mapped_column(unique=True)
+    uri: Mapped[str]  # shared by every mint of a hidden settings drop
     seller_fee_basis_points: Mapped[int]
     primary_sale_happened: Mapped[int]
     is_mutable: Mapped[bool]
@@ -51,10 +57,77 @@ class NftMint(NftMintBase):
     collection_details_size: Mapped[Optional[int]]
     programmable_config_label: Mapped[Optional[str]]
     programmable_config_rule_set: Mapped[Optional[str]]
-    blocktime: Mapped[int]
+    blocktime: Mapped[int] = mapped_column(index=True)
     mint_at: Mapped[datetime.datetime]
     create_at: Mapped[datetime.datetime] = mapped_column(default=func.now())
     last_update: Mapped[datetime.datetime]
+    account_hash: Mapped[Optional[str]]  # sha256 of the metadata account data
 
     creators: Mapped[Optional[List["MintCreator"]]] = relationship(back_populates="mint", lazy="selectin")
 
+class SyncCursor(NftMintBase):
+    __tablename__ = "sync_cursor"
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+    until_signature: Mapped[Optional[str]]
+    before_signature: Mapped[Optional[str]]
+    head_signature: Mapped[Optional[str]]
+    update_at: Mapped[datetime.datetime] = mapped_column(default=func.now(), onupdate=func.now())
+
+
+class OffchainMeta(NftMintBase):
+    # off-chain JSON documents keyed by the sha256 of their uri
+    __tablename__ = "offchain_meta"
+
+    uri_hash: Mapped[str] = mapped_column(primary_key=True)
+    uri: Mapped[str]
+    name: Mapped[Optional[str]]
+    description: Mapped[Optional[str]]
+    image: Mapped[Optional[str]]
+    animation_url: Mapped[Optional[str]]
+    external_url: Mapped[Optional[str]]
+    document: Mapped[Dict] = mapped_column(JSON().with_variant(JSONB(), "postgresql"))
+    fetched_at: Mapped[datetime.datetime] = mapped_column(default=func.now())
+
+class MintAttribute(NftMintBase):
+    __tablename__ = "mint_attribute"
+    __table_args__ = (Index("ix_mint_attribute_trait_type_value", "trait_type", "value"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    mint_key: Mapped[str] = mapped_column(ForeignKey("mint.mint"), index=True)
+    trait_type: Mapped[str]
+    value: Mapped[str]
+
+# Rollups kept up to date by metadb.upload_metas, so the /stats routes never scan the mint table.
+# collection_key is "" for mints without a collection.
+class MintHourly(NftMintBase):
+    __tablename__ = "stats_mint_hourly"
+
+    collection_key: Mapped[str] = mapped_column(primary_key=True)
+    hour: Mapped[int] = mapped_column(primary_key=True)
+    mints: Mapped[int]
+
+class MinterStats(NftMintBase):
+    __tablename__ = "stats_minter"
+    __table_args__ = (Index("ix_stats_minter_collection_key_mints", "collection_key", "mints"),)
+
+    collection_key: Mapped[str] = mapped_column(primary_key=True)
+    minter: Mapped[str] = mapped_column(primary_key=True)
+    mints: Mapped[int]
+
+class RoyaltyStats(NftMintBase):
+    __tablename__ = "stats_royalty"
+
+    collection_key: Mapped[str] = mapped_column(primary_key=True)
+    seller_fee_basis_points: Mapped[int] = mapped_column(primary_key=True)
+    mints: Mapped[int]
+
+class CreatorStats(NftMintBase):
+    __tablename__ = "stats_creator"
+    __table_args__ = (Index("ix_stats_creator_collection_key_mints", "collection_key", "mints"),)
+
+    collection_key: Mapped[str] = mapped_column(primary_key=True)
+    address: Mapped[str] = mapped_column(primary_key=True)
+    mints: Mapped[int]
+    verified_mints: Mapped[int]
+    share_total: Mapped[int]
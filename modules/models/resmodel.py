@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 from typing import List, Optional
 import datetime
 
@@ -43,3 +43,24 @@ class Mint(BaseModel):
     create_at: datetime.datetime
     last_update: datetime.datetime
 
+
+class MintPage(BaseModel):
+    items: List[Mint]
+    next: Optional[int] = None
+
+class MintBatchRequest(BaseModel):
+    # either addresses or names; collection_key only narrows name lookups
+    addresses: List[str] = Field(default_factory=list, max_length=1000)
+    names: List[str] = Field(default_factory=list, max_length=1000)
+    collection_key: Optional[str] = None
+
+    @model_validator(mode="after")
+    def one_kind(self):
+        if bool(self.addresses) == bool(self.names):
+            raise ValueError("pass either addresses or names")
+        return self
+
+class MintBatch(BaseModel):
+    # items follow the request order, None where nothing was found; missing lists those keys
+    items: List[Optional[Mint]]
+    missing: List[str]
@@ -1,66 +1,269 @@
 import asyncio
+import logging
+import time
 from solana.rpc.async_api import AsyncClient
 from solana.rpc.api import Client
 from solders.pubkey import Pubkey
 from solders.signature import Signature
 from solders.transaction import Transaction
-from modules.metaplex import get_metadata
-from typing import Dict, List
+from modules.metaplex import decode_metadatas, get_decode_executor, get_metadata_account
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 from modules import metadb
-from modules.metaplex import Metadata
-import json
-from sqlalchemy import exc
+from modules.metrics import BATCH_SIZE, FUNCTION_LATENCY, INGEST_ERRORS, INGEST_HEARTBEAT, timed
+from modules.pipeline import FailureTracker, MintPipeline, PipelineConfig, PipelineError
+from modules.rpc import RateLimiter, TransactionNotFound, call_with_retry
+from modules.rpccache import RpcCache
+from solana.rpc.websocket_api import connect
+from solders.rpc.config import RpcTransactionLogsFilterMentions
+from solders.rpc.responses import GetTransactionResp, LogsNotification
+from collections import OrderedDict
+import websockets
 
-async def update_mint(endpoint: str, pubkeys: Dict, async_session: async_sessionmaker[AsyncSession],
-        first_args: Dict) -> None:
+logger = logging.getLogger(__name__)
+
+SIGNATURE_PAGE_LIMIT = 1000
+STREAM_SEEN_SIZE = 10000
+STREAM_RECONNECT_DELAY = 5
+STREAM_CHECKPOINT_INTERVAL = 30
+
+def watch_cursor_name(pubkeys: Dict) -> str:
+    return f"watch:{pubkeys['collection']}"
+
+async def update_mint(client: AsyncClient, pubkeys: Dict, async_session: async_sessionmaker[AsyncSession],
+        first_args: Dict, config: Optional[PipelineConfig] = None, limiter: Optional[RateLimiter] = None) -> None:
+    # the client (and its connection pool) is shared by the watchers of all collections
+    failures = FailureTracker((config or PipelineConfig()).max_attempts)
     while True:
         if not first_args["running"]:
             first_args["running"] = True
+            INGEST_HEARTBEAT.set(time.time())
             try:
-                async with AsyncClient(endpoint) as client:
-                    res = await client.is_connected()
-                    collection_data = await client.get_signatures_for_address(
-                            Pubkey.from_string(pubkeys["collection"]),
-                            commitment="finalized",
-                            until=Signature.from_string(first_args["lastsignature"])
-                            )
-                    collection_data_json = json.loads(collection_data.to_json())
-                    signatures = [d["signature"] for d in collection_data_json['result']]
-                    nft_metas = await collect_nfts(client, signatures, pubkeys)
-                    if nft_metas:
-                        await metadb.upload_metas(async_session, nft_metas)
-            except exc.SQLAlchemyError as e:
-                print(type(e))
+                signatures = []
+                async for page in iter_signature_pages(client, pubkeys["collection"], first_args["lastsignature"],
+                        limiter=limiter):
+                    signatures.extend(page)
+                newest = signatures[0] if signatures else None
+                async with MintPipeline(client, async_session, fetch_mint_info, config, limiter,
+                        failures=failures) as pipeline:
+                    # pages come newest first, put oldest first so inserted ids follow mint time
+                    for signature in reversed(signatures):
+                        await pipeline.put(signature)
+                    # raises on transient failures, the cursor stays and the next cycle polls them again
+                    await pipeline.drain()
+                if newest:
+                    first_args["lastsignature"] = newest
+                    await metadb.save_cursor(async_session, watch_cursor_name(pubkeys), newest, None, newest)
+            except Exception:
+                INGEST_ERRORS.inc(stage="poll")
+                logger.exception("poll of %s failed", pubkeys["collection"])
             await asyncio.sleep(5)
             first_args["running"] = False
 
-async def collect_nfts(client: AsyncClient, signatures: List[str], pubkeys: List[str]) -> List[Metadata]:
-    nft_metas = []
-    for i, signature in enumerate(signatures):
+def websocket_endpoint(endpoint: str) -> str:
+    return endpoint.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+
+async def stream_mint(client: AsyncClient, ws_endpoint: str, pubkeys: Dict,
+        async_session: async_sessionmaker[AsyncSession], first_args: Dict, config: Optional[PipelineConfig] = None,
+        limiter: Optional[RateLimiter] = None) -> None:
+    # Push based alternative to update_mint: signatures from logsSubscribe on the candy machine and
+    # candy guard programs are fed to a long running MintPipeline. On every (re)connect the
+    # collection signatures since first_args["lastsignature"] are polled once so nothing missed
+    # while disconnected is lost. The watch cursor moves every STREAM_CHECKPOINT_INTERVAL seconds,
+    # once everything enqueued so far is written.
+    seen: OrderedDict = OrderedDict()
+    # the program subscriptions also see mints of other collections
+    async with MintPipeline(client, async_session, fetch_mint_info, config, limiter,
+            collection=pubkeys["collection"]) as pipeline:
+        while True:
+            try:
+                async with connect(ws_endpoint) as websocket:
+                    for program_id in (pubkeys["candyguardgid"], pubkeys["candyprogid"]):
+                        await websocket.logs_subscribe(RpcTransactionLogsFilterMentions(Pubkey.from_string(program_id)),
+                                commitment="finalized")
+                    # notifications arriving meanwhile are buffered by the socket
+                    newest = await fill_gap(client, pubkeys, first_args, pipeline, seen, limiter)
+                    await checkpoint(async_session, pubkeys, first_args, pipeline, seen, newest)
+                    checkpoint_at = time.monotonic()
+                    async for messages in websocket:
+                        INGEST_HEARTBEAT.set(time.time())
+                        for message in messages:
+                            if isinstance(message, LogsNotification) and message.result.value.err is None:
+                                await enqueue_signature(pipeline, seen, str(message.result.value.signature))
+                        if time.monotonic() - checkpoint_at >= STREAM_CHECKPOINT_INTERVAL:
+                            await checkpoint(async_session, pubkeys, first_args, pipeline, seen)
+                            checkpoint_at = time.monotonic()
+            except (websockets.ConnectionClosed, OSError) as e:
+                INGEST_ERRORS.inc(stage="stream")
+                logger.warning("websocket %s closed: %s", ws_endpoint, e)
+            except Exception:
+                # RPC errors in fill_gap, lost mints: reconnect and poll again from the cursor
+                INGEST_ERRORS.inc(stage="stream")
+                logger.exception("stream of %s failed", pubkeys["collection"])
+            await asyncio.sleep(STREAM_RECONNECT_DELAY)
+
+async def enqueue_signature(pipeline: MintPipeline, seen: OrderedDict, signature: str) -> None:
+    if signature in seen:
+        return
+    seen[signature] = True
+    if len(seen) > STREAM_SEEN_SIZE:
+        seen.popitem(last=False)
+    await pipeline.put(signature)
+
+async def fill_gap(client: AsyncClient, pubkeys: Dict, first_args: Dict, pipeline: MintPipeline, seen: OrderedDict,
+        limiter: Optional[RateLimiter] = None) -> Optional[str]:
+    # returns the newest collection signature, the cursor once the gap is written
+    newest = None
+    async for page in iter_signature_pages(client, pubkeys["collection"], first_args["lastsignature"], limiter=limiter):
+        newest = newest or page[0]
+        for signature in page:
+            await enqueue_signature(pipeline, seen, signature)
+    return newest
+
+async def checkpoint(async_session: async_sessionmaker[AsyncSession], pubkeys: Dict, first_args: Dict,
+        pipeline: MintPipeline, seen: OrderedDict, newest: Optional[str] = None) -> None:
+    # Waits for the pipeline, then saves `newest` or the newest mint written since the last
+    # checkpoint. Failed signatures are forgotten by `seen` so the next fill_gap enqueues them again.
+    try:
+        await pipeline.drain()
+    except PipelineError as e:
+        pipeline.newest = None
+        for signature in e.signatures:
+            seen.pop(signature, None)
+        raise
+    if not newest and pipeline.newest:
+        newest = pipeline.newest[1]
+    pipeline.newest = None
+    if newest and newest != first_args["lastsignature"]:
+        first_args["lastsignature"] = newest
+        await metadb.save_cursor(async_session, watch_cursor_name(pubkeys), newest, None, newest)
+
+async def backfill(client: AsyncClient, pubkeys: Dict, async_session: async_sessionmaker[AsyncSession],
+        until: Optional[str] = None, config: Optional[PipelineConfig] = None, limiter: Optional[RateLimiter] = None) -> None:
+    # Walks the collection history newest to oldest down to `until`, storing the page cursor
+    # once a page is written so an interrupted run resumes where it stopped. Failed signatures of a
+    # page are retried before its cursor is saved, until written or given up on. Without `until` an
+    # interrupted run is resumed, a finished one catches up to its head, and a first run goes down
+    # to the collection's mint_signature; an explicit `until` starts a new walk unless it is the
+    # one being resumed.
+    name = pubkeys["collection"]
+    before = None
+    head = None
+    cursor = await metadb.load_cursor(async_session, name)
+    if cursor and cursor.before_signature and until in (None, cursor.until_signature):
+        until, before, head = cursor.until_signature, cursor.before_signature, cursor.head_signature
+        logger.info("resume backfill %s before %s", name, before)
+    elif until is None:
+        until = cursor.until_signature if cursor and cursor.until_signature else pubkeys["mintsignature"]
+    async with MintPipeline(client, async_session, fetch_mint_info, config, limiter) as pipeline:
+        async for page in iter_signature_pages(client, name, until, before, limiter):
+            if not head:
+                head = page[0]
+            for signature in page:
+                await pipeline.put(signature)
+            await drain_page(pipeline)
+            await metadb.save_cursor(async_session, name, until, page[-1], head)
+            logger.info("backfill %s: %d signatures, before %s", name, len(page), page[-1])
+    if head:
+        await metadb.save_cursor(async_session, name, head, None, head)
+
+async def drain_page(pipeline: MintPipeline) -> None:
+    # puts failed signatures through again until they are written or given up on
+    while True:
         try:
-            tx = await client.get_transaction(Signature.from_string(signature), encoding="jsonParsed", commitment="finalized", 
-                max_supported_transaction_version=3)
-            json_data = json.loads(tx.value.transaction.to_json())
-            #instructions = json_data['meta']['innerInstructions'][0]['instructions']
-            instructions = json_data['transaction']['message']['instructions']
-            #print(f"{i}. {instructions}")
-            mint_program = instructions[1]
-            nft_mint = ""
-            nft_minter = ""
-            if "Guard" in mint_program['programId']:
-                nft_mint = mint_program['accounts'][6]
-                nft_minter = mint_program['accounts'][5]
-            elif "Cndy" in mint_program['programId']:
-                nft_mint = mint_program['accounts'][5]
-                nft_minter = mint_program['accounts'][4]
-            else:
+            return await pipeline.drain()
+        except PipelineError as e:
+            for signature in e.signatures:
+                await pipeline.put(signature)
+
+async def fetch_signature_page(client: AsyncClient, address: str, until: Optional[str], before: Optional[str] = None,
+        limiter: Optional[RateLimiter] = None) -> List[str]:
+    collection_data = await call_with_retry(lambda: client.get_signatures_for_address(
+            Pubkey.from_string(address),
+            before=Signature.from_string(before) if before else None,
+            until=Signature.from_string(until) if until else None,
+            limit=SIGNATURE_PAGE_LIMIT,
+            commitment="finalized"
+            ), limiter, method="getSignaturesForAddress")
+    BATCH_SIZE.observe(len(collection_data.value), stage="signatures")
+    return [str(d.signature) for d in collection_data.value]
+
+async def iter_signature_pages(client: AsyncClient, address: str, until: Optional[str], before: Optional[str] = None,
+        limiter: Optional[RateLimiter] = None) -> AsyncIterator[List[str]]:
+    # Pages go newest to oldest; a short page means `until` (or the first signature) was reached.
+    while True:
+        signatures = await fetch_signature_page(client, address, until, before, limiter)
+        if not signatures:
+            return
+        yield signatures
+        if len(signatures) < SIGNATURE_PAGE_LIMIT:
+            return
+        before = signatures[-1]
+
+@timed(FUNCTION_LATENCY, function="fetch_mint_info")
+async def fetch_mint_info(client: AsyncClient, signature: str, limiter: Optional[RateLimiter] = None,
+        cache: Optional[RpcCache] = None) -> Optional[Tuple[str, str, str, int]]:
+    # transactions never change, a cached copy is used instead of the RPC node
+    cached = cache.get_transaction(signature) if cache else None
+    if cached:
+        tx = GetTransactionResp.from_json(cached.decode())
+        if tx.value is not None:
+            return parse_mint_info(signature, tx)
+    tx = await call_with_retry(lambda: client.get_transaction(Signature.from_string(signature), encoding="jsonParsed",
+        commitment="finalized", max_supported_transaction_version=3), limiter, method="getTransaction")
+    if tx.value is None:
+        raise TransactionNotFound(signature)
+    if cache:
+        cache.put_transaction(signature, tx.to_json().encode())
+    return parse_mint_info(signature, tx)
+
+def parse_mint_info(signature: str, tx: GetTransactionResp) -> Optional[Tuple[str, str, str, int]]:
+    # read the instructions from the parsed solders objects, no to_json()/json.loads round trip
+    # other transactions on the collection address (updates of the collection NFT, ...) are not mints
+    instructions = tx.value.transaction.transaction.message.instructions
+    if len(instructions) < 2:
+        return None
+    mint_program = instructions[1]
+    program_id = str(mint_program.program_id)
+    accounts = getattr(mint_program, "accounts", None) or []
+    if "Guard" in program_id and len(accounts) > 6:
+        nft_mint = str(accounts[6])
+        nft_minter = str(accounts[5])
+    elif "Cndy" in program_id and len(accounts) > 5:
+        nft_mint = str(accounts[5])
+        nft_minter = str(accounts[4])
+    else:
+        return None
+    # block_time comes with the jsonParsed response, no second get_transaction needed
+    return nft_mint, nft_minter, signature, tx.value.block_time
+
+async def reindex_from_cache(cache: RpcCache, async_session: async_sessionmaker[AsyncSession],
+        config: Optional[PipelineConfig] = None, collections: Optional[List[str]] = None) -> None:
+    # Rebuilds the mint rows from the cached transactions and metadata accounts, without network.
+    # The cache also holds mints of other collections seen in stream mode, only those of
+    # collections are kept.
+    config = config or PipelineConfig()
+    executor = get_decode_executor(config.decode_executor, config.decode_workers)
+    total = 0
+    for transactions in cache.iter_transactions(config.sink_batch_size):
+        accounts = []
+        for signature, data in transactions:
+            mint_info = parse_mint_info(signature, GetTransactionResp.from_json(data.decode()))
+            if not mint_info:
                 continue
-            tx_norm = await client.get_transaction(Signature.from_string(signature), commitment="finalized",
-                    max_supported_transaction_version=3)
-            blocktime = tx_norm.value.block_time
-            meta_data = await get_metadata(client, nft_mint, nft_minter, signature, blocktime)
-            nft_metas.append(meta_data)
-        except exc.SQLAlchemyError as e:
-            print(type(e))
-    return nft_metas 
+            account = cache.get_account(str(get_metadata_account(mint_info[0])))
+            if account:
+                accounts.append((account, *mint_info[1:]))
+        if executor:
+            nft_metas, failed = await asyncio.get_running_loop().run_in_executor(executor, decode_metadatas, accounts)
+        else:
+            nft_metas, failed = decode_metadatas(accounts)
+        for signature, error in failed:
+            logger.warning("reindex: metadata of %s does not decode: %s", signature, error)
+        if collections is not None:
+            nft_metas = [meta for meta in nft_metas if meta.collection and str(meta.collection.key) in collections]
+        if nft_metas:
+            nft_metas.sort(key=lambda meta: meta.blocktime)
+            await metadb.upload_metas(async_session, nft_metas, config.sink_batch_size, on_conflict="update")
+        total += len(nft_metas)
+        logger.info("reindex: %d mints", total)
@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import ipaddress
+import logging
+import random
+import time
+import httpx
+import orjson
+from dataclasses import dataclass
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from typing import Dict, List, Optional, Tuple
+
+from modules import metadb
+from modules.models.nftmint import MintAttribute, NftMint, OffchainMeta
+from modules.metrics import OFFCHAIN_FETCHES, OFFCHAIN_LATENCY
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+MAX_DOCUMENT_SIZE = 1 << 20
+
+@dataclass
+class OffchainConfig:
+    concurrency: int = 16
+    timeout: float = 10.0
+    retries: int = 3
+    backoff: float = 0.5
+    ipfs_gateway: str = "https://ipfs.io/ipfs/"
+    arweave_gateway: str = "https://arweave.net/"
+    # uris are set by whoever mints, by default only hosts on the public internet are fetched
+    allow_private_hosts: bool = False
+
+def uri_hash(uri: str) -> str:
+    return hashlib.sha256(uri.encode()).hexdigest()
+
+def resolve_uri(uri: str, config: OffchainConfig) -> str:
+    if uri.startswith("ipfs://"):
+        return config.ipfs_gateway + uri[len("ipfs://"):].removeprefix("ipfs/")
+    if uri.startswith("ar://"):
+        return config.arweave_gateway + uri[len("ar://"):]
+    return uri
+
+def _retry_after(response: httpx.Response) -> float:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else 0
+    except ValueError:
+        # HTTP-date form, the backoff applies
+        return 0
+
+async def check_url(url: httpx.URL, allow_private_hosts: bool = False) -> None:
+    # raises ValueError for anything but http(s) to a host that only resolves to global addresses
+    if url.scheme not in ("http", "https"):
+        raise ValueError(f"scheme {url.scheme!r} not allowed")
+    if not url.host:
+        raise ValueError("no host")
+    if allow_private_hosts:
+        return
+    port = url.port or (443 if url.scheme == "https" else 80)
+    for *_, sockaddr in await asyncio.get_running_loop().getaddrinfo(url.host, port):
+        address = ipaddress.ip_address(sockaddr[0])
+        if not address.is_global:
+            raise ValueError(f"{url.host} resolves to {address}")
+
+def to_attribute_rows(mint_key: str, document: Dict) -> List[Dict]:
+    # Metaplex JSON standard: "attributes": [{"trait_type": ..., "value": ...}], values kept as text
+    attributes = document.get("attributes")
+    if not isinstance(attributes, list):
+        return []
+    rows = []
+    for attribute in attributes:
+        if not isinstance(attribute, dict) or "value" not in attribute:
+            continue
+        value = attribute["value"]
+        rows.append({
+            "mint_key": mint_key,
+            "trait_type": str(attribute.get("trait_type") or ""),
+            "value": value if isinstance(value, str) else orjson.dumps(value).decode()
+            })
+    return rows
+
+class OffchainFetcher:
+    # Resolves NftMint.uri documents with one pooled httpx client. Documents are stored by the
+    # sha256 of their uri, a uri already in offchain_meta is never fetched again.
+    def __init__(self, config: Optional[OffchainConfig] = None):
+        self.config = config or OffchainConfig()
+        self.client = httpx.AsyncClient(
+                timeout=self.config.timeout,
+                # redirects are followed by _get, every hop is checked
+                follow_redirects=False,
+                limits=httpx.Limits(max_connections=self.config.concurrency,
+                    max_keepalive_connections=self.config.concurrency)
+                )
+        self.semaphore = asyncio.Semaphore(self.config.concurrency)
+
+    async def _get(self, url: httpx.URL) -> Tuple[httpx.Response, bytes]:
+        # the body is read only for a 200 and abandoned once it passes MAX_DOCUMENT_SIZE
+        for _ in range(MAX_REDIRECTS + 1):
+            await check_url(url, self.config.allow_private_hosts)
+            async with self.client.stream("GET", url) as response:
+                if response.status_code in REDIRECT_STATUS and "location" in response.headers:
+                    url = url.join(response.headers["location"])
+                    continue
+                if response.status_code != 200:
+                    return response, b""
+                length = response.headers.get("Content-Length", "")
+                if length.isdigit() and int(length) > MAX_DOCUMENT_SIZE:
+                    raise ValueError(f"{length} bytes")
+                content = bytearray()
+                async for chunk in response.aiter_bytes():
+                    content += chunk
+                    if len(content) > MAX_DOCUMENT_SIZE:
+                        raise ValueError(f"more than {MAX_DOCUMENT_SIZE} bytes")
+                return response, bytes(content)
+        raise ValueError(f"more than {MAX_REDIRECTS} redirects")
+
+    async def fetch(self, uri: str) -> Optional[Dict]:
+        # Never raises: network errors are retried, a blocked or malformed url and an invalid
+        # document are given up on at once, and all of them return None.
+        url = resolve_uri(uri, self.config)
+        attempt = 0
+        async with self.semaphore:
+            start = time.perf_counter()
+            try:
+                while True:
+                    try:
+                        response, content = await self._get(httpx.URL(url))
+                        if response.status_code not in RETRY_STATUS:
+                            break
+                        delay = _retry_after(response)
+                    except (httpx.TransportError, OSError) as e:
+                        response, delay = e, 0
+                    if attempt >= self.config.retries:
+                        break
+                    OFFCHAIN_FETCHES.inc(status="retry")
+                    await asyncio.sleep(max(delay, self.config.backoff * 2 ** attempt) + random.uniform(0, self.config.backoff))
+                    attempt += 1
+                if isinstance(response, Exception) or response.status_code != 200:
+                    OFFCHAIN_FETCHES.inc(status="error")
+                    logger.warning("fetch %s failed: %s", url, response if isinstance(response, Exception) else response.status_code)
+                    return None
+                document = orjson.loads(content)
+                if not isinstance(document, dict):
+                    raise ValueError("not a JSON object")
+            except (ValueError, httpx.InvalidURL, httpx.HTTPError) as e:
+                OFFCHAIN_FETCHES.inc(status="invalid")
+                logger.warning("fetch %s rejected: %s", url, e)
+                return None
+            finally:
+                OFFCHAIN_LATENCY.observe(time.perf_counter() - start)
+        OFFCHAIN_FETCHES.inc(status="ok")
+        return document
+
+    async def enrich(self, async_session: async_sessionmaker[AsyncSession], mints: List[Tuple[str, str]]) -> List[str]:
+        # mints are (mint, uri) pairs; returns the mints whose attributes were stored
+        hashes = {mint: uri_hash(uri) for mint, uri in mints}
+        documents = await metadb.load_offchain(async_session, list(set(hashes.values())))
+        OFFCHAIN_FETCHES.inc(sum(1 for mint in hashes if hashes[mint] in documents), status="cached")
+        pending = {hashes[mint]: uri for mint, uri in mints if hashes[mint] not in documents}
+        results = await asyncio.gather(*[self.fetch(uri) for uri in pending.values()])
+        fetched = {}
+        for (hash_, uri), document in zip(pending.items(), results):
+            if document is not None:
+                fetched[hash_] = (uri, document)
+                documents[hash_] = document
+        attributes = {mint: to_attribute_rows(mint, documents[hashes[mint]]) for mint in hashes if hashes[mint] in documents}
+        await metadb.upload_offchain(async_session, fetched, attributes)
+        return list(attributes)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+async def enrich_missing(async_session: async_sessionmaker[AsyncSession], fetcher: OffchainFetcher,
+        batch_size: int = metadb.DEFAULT_BATCH_SIZE) -> None:
+    # mints without attribute rows, in id order; documents already stored are not fetched again
+    after = 0
+    total = 0
+    while True:
+        async with async_session() as session:
+            stmt = select(NftMint.id, NftMint.mint, NftMint.uri).where(NftMint.id > after)\
+                    .where(~exists().where(MintAttribute.mint_key == NftMint.mint))\
+                    .order_by(NftMint.id).limit(batch_size)
+            rows = (await session.execute(stmt)).all()
+        if not rows:
+            return
+        after = rows[-1].id
+        total += len(await fetcher.enrich(async_session, [(row.mint, row.uri) for row in rows]))
+        logger.info("enrich: %d mints", total)
+
+async def load_mint_offchain(session: AsyncSession, address: str) -> Optional[Dict]:
+    result = await session.execute(select(NftMint.uri).where(NftMint.mint == address))
+    uri = result.scalar()
+    if uri is None:
+        return None
+    result = await session.execute(select(OffchainMeta.name, OffchainMeta.description, OffchainMeta.image,
+        OffchainMeta.animation_url, OffchainMeta.external_url, OffchainMeta.fetched_at)
+        .where(OffchainMeta.uri_hash == uri_hash(uri)))
+    document = result.mappings().first()
+    result = await session.execute(select(MintAttribute.trait_type, MintAttribute.value)
+            .where(MintAttribute.mint_key == address).order_by(MintAttribute.id))
+    return {"mint": address, "uri": uri, **(dict(document) if document else {}),
+            "attributes": [dict(row) for row in result.mappings()]}
+
+_fetchers: Dict[Tuple, OffchainFetcher] = {}
+
+def get_fetcher(config: Optional[OffchainConfig]) -> Optional[OffchainFetcher]:
+    # one client per process and configuration, pipelines come and go every poll cycle
+    if not config:
+        return None
+    key = tuple(vars(config).values())
+    if key not in _fetchers:
+        _fetchers[key] = OffchainFetcher(config)
+    return _fetchers[key]
@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from solana.rpc.async_api import AsyncClient
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from modules import metadb
+from modules.metaplex import METADATA_BATCH_SIZE, get_decode_executor, get_metadata_batch
+from modules.metrics import INGEST_ERRORS, INGEST_HEARTBEAT, OFFCHAIN_FETCHES, SKIPPED_SIGNATURES
+from modules.offchain import OffchainConfig, OffchainFetcher, get_fetcher
+from modules.rpc import TRANSIENT_ERRORS, RateLimiter
+from modules.rpccache import RpcCache, get_cache
+
+MintInfo = Tuple[str, str, str, int]
+FetchMintInfo = Callable[[AsyncClient, str, Optional[RateLimiter], Optional[RpcCache]], Awaitable[Optional[MintInfo]]]
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+@dataclass
+class PipelineConfig:
+    fetch_workers: int = 8
+    queue_size: int = 1000
+    sink_batch_size: int = metadb.DEFAULT_BATCH_SIZE
+    flush_interval: float = 2.0
+    decode_linger: float = 0.2
+    decode_executor: str = "thread"  # "inline", "thread" or "process"
+    decode_workers: int = 1
+    rpc_cache_path: Optional[str] = None
+    offchain: Optional[OffchainConfig] = None  # None disables the off-chain JSON stage
+    retries: int = 1  # times drain() puts failed signatures through the pipeline again
+    retry_delay: float = 2.0
+    max_attempts: int = 5  # failed drains before a signature that keeps failing to fetch or decode is skipped
+
+def is_transient(error: BaseException) -> bool:
+    # RPC and HTTP failures, transactions not served yet and lost database connections
+    if isinstance(error, exc.DBAPIError):
+        return error.connection_invalidated or isinstance(error, (exc.OperationalError, exc.InterfaceError))
+    return isinstance(error, (*TRANSIENT_ERRORS, exc.TimeoutError))
+
+class FailureTracker:
+    # Counts the drains a signature failed in, across the pipelines of one watcher. Signatures
+    # that keep failing to fetch or decode are given up on after `limit` so the cursor can move on,
+    # failed writes always hold it back: the database being down must not skip mints.
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.counts: Dict[str, int] = {}
+
+    def blocking(self, failed: Dict[str, str]) -> List[str]:
+        blocking = []
+        for signature, stage in failed.items():
+            self.counts[signature] = self.counts.get(signature, 0) + 1
+            if stage != "write" and self.counts[signature] >= self.limit:
+                del self.counts[signature]
+                SKIPPED_SIGNATURES.inc(stage=stage)
+                logger.error("giving up on %s after %d failed %s attempts", signature, self.limit, stage)
+            else:
+                blocking.append(signature)
+        if not blocking:
+            self.counts.clear()
+        return blocking
+
+class PipelineError(Exception):
+    # mints that could not be fetched, decoded or written; callers keep their cursor behind them
+    def __init__(self, signatures: List[str]):
+        super().__init__(f"{len(signatures)} signatures failed, first {signatures[0]}")
+        self.signatures = signatures
+
+async def take_batch(queue: asyncio.Queue, size: int, timeout: float) -> List[Any]:
+    # waits for one item, then collects up to `size` items for at most `timeout` seconds
+    loop = asyncio.get_running_loop()
+    items = [await queue.get()]
+    deadline = loop.time() + timeout
+    while len(items) < size and items[-1] is not _DONE:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            items.append(await asyncio.wait_for(queue.get(), remaining))
+        except asyncio.TimeoutError:
+            break
+    return items
+
+class OffchainEnricher:
+    # Off-chain JSON stage shared by every pipeline of the process and running for its lifetime,
+    # pipelines hand their written mints over without waiting, so a slow metadata host never
+    # delays the mint rows. Mints that do not fit the queue are left to `python -m modules.ingest enrich`.
+    def __init__(self, fetcher: OffchainFetcher, async_session: async_sessionmaker[AsyncSession],
+            queue_size: int, batch_size: int, flush_interval: float):
+        self.fetcher = fetcher
+        self.async_session = async_session
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def submit(self, mints: List[Tuple[str, str]]) -> None:
+        # mints are (mint, uri) pairs
+        if not self.task or self.task.done() or self.task.get_loop() is not asyncio.get_running_loop():
+            self.queue = asyncio.Queue(self.queue_size)
+            self.task = asyncio.create_task(self._run())
+        for mint in mints:
+            if self.queue.full():
+                OFFCHAIN_FETCHES.inc(status="dropped")
+                continue
+            self.queue.put_nowait(mint)
+
+    async def drain(self) -> None:
+        # only for benchmarks and one-shot runs, pipelines never wait for the enricher
+        if self.queue:
+            await self.queue.join()
+
+    async def close(self) -> None:
+        # mints still queued are left to `python -m modules.ingest enrich`
+        if self.task and self.task.get_loop() is asyncio.get_running_loop():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+        self.queue = None
+
+    async def _run(self) -> None:
+        while True:
+            batch = await take_batch(self.queue, self.batch_size, self.flush_interval)
+            try:
+                await self.fetcher.enrich(self.async_session, batch)
+            except Exception:
+                INGEST_ERRORS.inc(stage="offchain")
+                logger.exception("off-chain enrichment of %d mints failed", len(batch))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+_enrichers: Dict[Tuple, OffchainEnricher] = {}
+
+def get_enricher(config: PipelineConfig, async_session: async_sessionmaker[AsyncSession]) -> Optional[OffchainEnricher]:
+    if not config.offchain:
+        return None
+    key = (tuple(vars(config.offchain).values()), async_session)
+    if key not in _enrichers:
+        _enrichers[key] = OffchainEnricher(get_fetcher(config.offchain), async_session, config.queue_size,
+                config.sink_batch_size, config.flush_interval)
+    return _enrichers[key]
+
+async def drain_enrichers() -> None:
+    for enricher in list(_enrichers.values()):
+        await enricher.drain()
+
+async def close_enrichers() -> None:
+    # The enrichers outlive the pipelines that feed them, whoever stops ingestion stops them too,
+    # so an ingester that lost its lock does not keep writing.
+    enrichers = list(_enrichers.values())
+    _enrichers.clear()
+    for enricher in enrichers:
+        await enricher.close()
+
+class MintPipeline:
+    # signature source -> transaction fetch -> metadata decode -> batched DB sink [-> OffchainEnricher].
+    # Stages are connected by bounded queues, so a slow stage holds back the ones before it
+    # instead of buffering, and the sink writes every `sink_batch_size` mints or `flush_interval`
+    # seconds, whichever comes first.
+    def __init__(self, client: AsyncClient, async_session: async_sessionmaker[AsyncSession], fetch: FetchMintInfo,
+            config: Optional[PipelineConfig] = None, limiter: Optional[RateLimiter] = None,
+            collection: Optional[str] = None, failures: Optional[FailureTracker] = None):
+        self.client = client
+        self.async_session = async_session
+        self.fetch = fetch
+        self.config = config or PipelineConfig()
+        self.limiter = limiter
+        self.collection = collection
+        self.cache = get_cache(self.config.rpc_cache_path)
+        self.signatures = asyncio.Queue(self.config.queue_size)
+        self.mint_infos = asyncio.Queue(self.config.queue_size)
+        self.metadatas = asyncio.Queue(self.config.queue_size)
+        self.enricher = get_enricher(self.config, async_session)
+        self.fetchers = []
+        self.decoder = None
+        self.sink = None
+        self.failures = failures or FailureTracker(self.config.max_attempts)
+        self.failed: Dict[str, str] = {}  # signature -> stage of transient failures
+        self.error: Optional[BaseException] = None
+        self.newest: Optional[Tuple[int, str]] = None  # (blocktime, signature) of the newest mint written
+
+    def start(self) -> None:
+        self.fetchers = [asyncio.create_task(self._fetch()) for _ in range(self.config.fetch_workers)]
+        self.decoder = asyncio.create_task(self._decode())
+        self.sink = asyncio.create_task(self._sink())
+
+    async def put(self, signature: str) -> None:
+        await self.signatures.put(signature)
+
+    async def _join(self) -> None:
+        await self.signatures.join()
+        await self.mint_infos.join()
+        await self.metadatas.join()
+
+    async def drain(self) -> None:
+        # Returns once everything put so far has been written. Failed signatures are put again up
+        # to `retries` times, a transaction can be missing shortly after its signature is listed.
+        await self._join()
+        for _ in range(self.config.retries):
+            if not self.failed:
+                break
+            failed, self.failed = self.failed, {}
+            await asyncio.sleep(self.config.retry_delay)
+            for signature in failed:
+                await self.signatures.put(signature)
+            await self._join()
+        self.raise_failed()
+
+    def raise_failed(self) -> None:
+        # the failures are reported once, the caller decides what to poll again
+        failed, error, self.failed, self.error = self.failed, self.error, {}, None
+        blocking = self.failures.blocking(failed) if failed else []
+        if blocking:
+            raise PipelineError(blocking) from error
+
+    def _fail(self, stage: str, signatures: List[str], error: BaseException) -> None:
+        # Transient failures are retried by drain() and hold the caller's cursor back. Anything
+        # else fails the same way on every attempt, those signatures are skipped.
+        if is_transient(error):
+            self.failed.update(dict.fromkeys(signatures, stage))
+            self.error = self.error or error
+        else:
+            SKIPPED_SIGNATURES.inc(len(signatures), stage=stage)
+            logger.error("skipped %d signatures after a %s failure, first %s: %s", len(signatures), stage,
+                    signatures[0], error)
+
+    async def close(self) -> None:
+        for _ in self.fetchers:
+            await self.signatures.put(_DONE)
+        await asyncio.gather(*self.fetchers)
+        await self.mint_infos.put(_DONE)
+        await self.decoder
+        await self.metadatas.put(_DONE)
+        await self.sink
+        self.raise_failed()
+
+    def cancel(self) -> None:
+        for task in [*self.fetchers, self.decoder, self.sink]:
+            if task:
+                task.cancel()
+
+    async def __aenter__(self) -> "MintPipeline":
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type:
+            self.cancel()
+        else:
+            await self.close()
+
+    async def _fetch(self) -> None:
+        while True:
+            signature = await self.signatures.get()
+            try:
+                if signature is _DONE:
+                    return
+                mint_info = await self.fetch(self.client, signature, self.limiter, self.cache)
+                if mint_info:
+                    await self.mint_infos.put(mint_info)
+            except Exception as e:
+                INGEST_ERRORS.inc(stage="fetch")
+                logger.exception("fetch %s failed", signature)
+                self._fail("fetch", [signature], e)
+            finally:
+                self.signatures.task_done()
+
+    async def _decode(self) -> None:
+        executor = get_decode_executor(self.config.decode_executor, self.config.decode_workers)
+        while True:
+            batch = await take_batch(self.mint_infos, METADATA_BATCH_SIZE, self.config.decode_linger)
+            mint_infos = [mint_info for mint_info in batch if mint_info is not _DONE]
+            try:
+                if mint_infos:
+                    metas, failed = await get_metadata_batch(self.client, mint_infos, self.limiter, executor, self.cache)
+                    for signature, error in failed:
+                        INGEST_ERRORS.inc(stage="decode")
+                        self._fail("decode", [signature], ValueError(error))
+                    for meta in metas:
+                        if self.collection and not (meta.collection and str(meta.collection.key) == self.collection):
+                            continue
+                        await self.metadatas.put(meta)
+            except Exception as e:
+                INGEST_ERRORS.inc(stage="decode")
+                logger.exception("decode of %d mints failed", len(mint_infos))
+                self._fail("decode", [mint_info[2] for mint_info in mint_infos], e)
+            finally:
+                for _ in batch:
+                    self.mint_infos.task_done()
+            if len(mint_infos) < len(batch):
+                return
+
+    async def _sink(self) -> None:
+        while True:
+            batch = await take_batch(self.metadatas, self.config.sink_batch_size, self.config.flush_interval)
+            nft_metas = sorted((meta for meta in batch if meta is not _DONE), key=lambda meta: meta.blocktime)
+            try:
+                if nft_metas:
+                    await self._write(nft_metas)
+                INGEST_HEARTBEAT.set(time.time())
+            except Exception as e:
+                INGEST_ERRORS.inc(stage="write")
+                logger.exception("write of %d mints failed", len(nft_metas))
+                if is_transient(e) or len(nft_metas) == 1:
+                    self._fail("write", [str(meta.signature) for meta in nft_metas], e)
+                else:
+                    # one bad row fails the whole chunk, write them one by one to find it
+                    await self._write_each(nft_metas)
+            finally:
+                for _ in batch:
+                    self.metadatas.task_done()
+            if len(nft_metas) < len(batch):
+                return
+
+    async def _write(self, nft_metas: List) -> None:
+        written = await metadb.upload_metas(self.async_session, nft_metas, self.config.sink_batch_size)
+        newest = (nft_metas[-1].blocktime, str(nft_metas[-1].signature))
+        self.newest = max(self.newest, newest) if self.newest else newest
+        if self.enricher:
+            uris = {str(meta.mint): meta.uri for meta in nft_metas}
+            self.enricher.submit([(mint, uris[mint]) for mint in written])
+
+    async def _write_each(self, nft_metas: List) -> None:
+        for meta in nft_metas:
+            try:
+                await self._write([meta])
+            except Exception as e:
+                logger.exception("write of %s failed", meta.mint)
+                self._fail("write", [str(meta.signature)], e)
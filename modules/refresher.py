@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from solana.rpc.async_api import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from typing import List, Optional, Tuple
+
+from modules import metadb
+from modules.metaplex import METADATA_BATCH_SIZE, account_hash, decode_metadatas, get_metadata_account
+from modules.metrics import INGEST_ERRORS, REFRESH
+from modules.models.nftmint import NftMint
+from modules.pipeline import is_transient
+from modules.rpc import RateLimiter, call_with_retry
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RefreshConfig:
+    rate: float = 50  # metadata accounts per second, 0 for no limit
+    interval: float = 3600  # seconds between the starts of two scans
+    batch_size: int = 1000  # mints read and written per database round trip
+
+async def changed_accounts(client: AsyncClient, rows: List, limiter: Optional[RateLimiter],
+        scan_limiter: RateLimiter) -> List[Tuple[bytes, str, str, int]]:
+    # Rows are (mint, minter, signature, blocktime, account_hash). Only accounts whose bytes hash
+    # differently are returned for decoding, with the transaction columns of the stored row.
+    accounts = []
+    for i in range(0, len(rows), METADATA_BATCH_SIZE):
+        chunk = rows[i:i + METADATA_BATCH_SIZE]
+        metadata_accounts = [get_metadata_account(row.mint) for row in chunk]
+        await scan_limiter.acquire()
+        client_data = await call_with_retry(lambda: client.get_multiple_accounts(metadata_accounts,
+            commitment="finalized", encoding="base64"), limiter, method="getMultipleAccounts")
+        for row, account in zip(chunk, client_data.value):
+            if not account:
+                REFRESH.inc(status="missing")
+            elif account_hash(account.data) == row.account_hash:
+                REFRESH.inc(status="unchanged")
+            else:
+                REFRESH.inc(status="changed")
+                accounts.append((account.data, row.minter, row.signature, row.blocktime))
+    return accounts
+
+async def upload_changed(async_session: async_sessionmaker[AsyncSession], nft_metas: List, batch_size: int) -> int:
+    # A batch refused for another reason than the database being unreachable is written row by
+    # row, so one bad row does not hold back the others. Returns the number of mints updated.
+    try:
+        return len(await metadb.upload_metas(async_session, nft_metas, batch_size, on_conflict="update"))
+    except Exception as e:
+        if is_transient(e) or len(nft_metas) == 1:
+            raise
+        logger.warning("refresh: update of %d mints failed, writing them one by one: %s", len(nft_metas), e)
+    updated = 0
+    for meta in nft_metas:
+        try:
+            updated += len(await metadb.upload_metas(async_session, [meta], batch_size, on_conflict="update"))
+        except Exception:
+            INGEST_ERRORS.inc(stage="refresh")
+            REFRESH.inc(status="failed")
+            logger.exception("refresh: update of %s failed", meta.mint)
+    return updated
+
+async def refresh_batch(client: AsyncClient, async_session: async_sessionmaker[AsyncSession], rows: List,
+        config: RefreshConfig, limiter: Optional[RateLimiter], scan_limiter: RateLimiter,
+        executor: Optional[Executor]) -> int:
+    accounts = await changed_accounts(client, rows, limiter, scan_limiter)
+    if not accounts:
+        return 0
+    if executor:
+        nft_metas, failed = await asyncio.get_running_loop().run_in_executor(executor, decode_metadatas, accounts)
+    else:
+        nft_metas, failed = decode_metadatas(accounts)
+    for signature, error in failed:
+        REFRESH.inc(status="invalid")
+        logger.warning("refresh: account of mint signature %s does not decode: %s", signature, error)
+    return await upload_changed(async_session, nft_metas, config.batch_size) if nft_metas else 0
+
+async def refresh_pass(client: AsyncClient, async_session: async_sessionmaker[AsyncSession],
+        config: Optional[RefreshConfig] = None, limiter: Optional[RateLimiter] = None,
+        executor: Optional[Executor] = None) -> int:
+    # One scan of the mutable mints in id order. The shared limiter keeps the refresher inside the
+    # RPC budget, the scan limiter caps its share of it. A failed batch is logged and left to the
+    # next pass, the scan goes on. Returns the number of mints updated.
+    config = config or RefreshConfig()
+    scan_limiter = RateLimiter(config.rate / METADATA_BATCH_SIZE, burst=1)
+    after = 0
+    checked = 0
+    updated = 0
+    while True:
+        async with async_session() as session:
+            stmt = select(NftMint.id, NftMint.mint, NftMint.minter, NftMint.signature, NftMint.blocktime,
+                    NftMint.account_hash).where(NftMint.is_mutable, NftMint.id > after)\
+                    .order_by(NftMint.id).limit(config.batch_size)
+            rows = (await session.execute(stmt)).all()
+        if not rows:
+            break
+        after = rows[-1].id
+        checked += len(rows)
+        try:
+            updated += await refresh_batch(client, async_session, rows, config, limiter, scan_limiter, executor)
+        except Exception:
+            INGEST_ERRORS.inc(stage="refresh")
+            logger.exception("refresh of %d mints up to id %d failed", len(rows), after)
+    logger.info("refresh: %d mutable mints checked, %d updated", checked, updated)
+    return updated
+
+async def run_refresher(client: AsyncClient, async_session: async_sessionmaker[AsyncSession],
+        config: Optional[RefreshConfig] = None, limiter: Optional[RateLimiter] = None,
+        executor: Optional[Executor] = None) -> None:
+    config = config or RefreshConfig()
+    while True:
+        start = time.monotonic()
+        try:
+            await refresh_pass(client, async_session, config, limiter, executor)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # a failed pass is retried on the next interval, live ingestion keeps running
+            INGEST_ERRORS.inc(stage="refresh")
+            logger.exception("refresh pass failed")
+        await asyncio.sleep(max(0, config.interval - (time.monotonic() - start)))
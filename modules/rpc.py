@@ -0,0 +1,83 @@
+import asyncio
+import random
+import time
+import httpx
+from solana.exceptions import SolanaRpcException
+from modules.metrics import RPC_CALLS, RPC_LATENCY
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 0.5
+
+class TransactionNotFound(Exception):
+    # getTransaction answered null, a signature can be listed before the node serves its transaction
+    pass
+
+# failures worth another attempt, anything else fails the same way again
+TRANSIENT_ERRORS = (SolanaRpcException, httpx.HTTPError, OSError, asyncio.TimeoutError, TransactionNotFound)
+
+class RateLimiter:
+    # Token bucket shared by every task talking to the same RPC endpoint.
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst if burst else max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+_limiters: Dict[str, RateLimiter] = {}
+
+def get_limiter(endpoint: str, rate: float) -> RateLimiter:
+    limiter = _limiters.get(endpoint)
+    if not limiter or limiter.rate != rate:
+        limiter = RateLimiter(rate)
+        _limiters[endpoint] = limiter
+    return limiter
+
+def _http_error(e: SolanaRpcException) -> Optional[httpx.HTTPStatusError]:
+    cause = e.__cause__
+    return cause if isinstance(cause, httpx.HTTPStatusError) else None
+
+def _retry_after(error: httpx.HTTPStatusError) -> Optional[float]:
+    value = error.response.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+async def call_with_retry(func: Callable[[], Awaitable[T]], limiter: Optional[RateLimiter] = None,
+        retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF, method: str = "rpc") -> T:
+    attempt = 0
+    start = time.perf_counter()
+    while True:
+        if limiter:
+            await limiter.acquire()
+        try:
+            result = await func()
+            RPC_CALLS.inc(method=method, status="ok")
+            RPC_LATENCY.observe(time.perf_counter() - start, method=method)
+            return result
+        except SolanaRpcException as e:
+            error = _http_error(e)
+            if not error or error.response.status_code != 429 or attempt >= retries:
+                RPC_CALLS.inc(method=method, status="error")
+                raise
+            RPC_CALLS.inc(method=method, status="throttled")
+            delay = _retry_after(error) or backoff * 2 ** attempt
+            await asyncio.sleep(delay + random.uniform(0, backoff))
+            attempt += 1
@@ -0,0 +1,135 @@
+import atexit
+import hashlib
+import logging
+import queue
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Raw get_transaction responses and metadata account bytes kept on disk so the mint table can be
+# rebuilt without the RPC node. Blobs are stored once per sha256 of their content; transactions
+# are keyed by signature (immutable), accounts by pubkey (latest copy wins).
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blob (hash TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS tx (signature TEXT PRIMARY KEY, hash TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS account (pubkey TEXT PRIMARY KEY, hash TEXT NOT NULL);
+"""
+WRITE_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+class RpcCache:
+    # Puts only enqueue, a writer thread compresses and stores them in batches of one transaction
+    # each, so the event loop never waits on SQLite. A put is readable once the writer got to it.
+    # Reads go through their own connection, WAL lets them run while the writer holds a transaction.
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.read_lock = threading.Lock()
+        self.reader = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.pending: queue.Queue = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, name="rpc-cache-writer", daemon=True)
+        self.writer.start()
+
+    def _put(self, table: str, key_column: str, key: str, data: bytes) -> None:
+        self.pending.put((table, key_column, key, data))
+
+    def _write_loop(self) -> None:
+        while True:
+            items = [self.pending.get()]
+            while items[-1] is not None and len(items) < WRITE_BATCH_SIZE:
+                try:
+                    items.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            puts = [item for item in items if item is not None]
+            try:
+                if puts:
+                    self._write(puts)
+            except Exception:
+                # the cache is best effort, a lost put is fetched from the RPC node again
+                logger.exception("rpc cache write of %d entries failed", len(puts))
+            finally:
+                for _ in items:
+                    self.pending.task_done()
+            if len(puts) < len(items):
+                return
+
+    def _write(self, puts: List[Tuple[str, str, str, bytes]]) -> None:
+        blobs = {}
+        keys: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+        for table, key_column, key, data in puts:
+            digest = hashlib.sha256(data).hexdigest()
+            if digest not in blobs:
+                blobs[digest] = zlib.compress(data)
+            keys.setdefault((table, key_column), []).append((key, digest))
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany("INSERT OR IGNORE INTO blob (hash, data) VALUES (?, ?)", blobs.items())
+                for (table, key_column), rows in keys.items():
+                    self.conn.executemany(f"INSERT OR REPLACE INTO {table} ({key_column}, hash) VALUES (?, ?)", rows)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def flush(self) -> None:
+        # blocks until every put so far is stored
+        self.pending.join()
+
+    def _get(self, table: str, key_column: str, key: str) -> Optional[bytes]:
+        with self.read_lock:
+            row = self.reader.execute(
+                    f"SELECT blob.data FROM {table} JOIN blob ON blob.hash = {table}.hash WHERE {key_column} = ?",
+                    (key,)).fetchone()
+        return zlib.decompress(row[0]) if row else None
+
+    def put_transaction(self, signature: str, data: bytes) -> None:
+        self._put("tx", "signature", signature, data)
+
+    def get_transaction(self, signature: str) -> Optional[bytes]:
+        return self._get("tx", "signature", signature)
+
+    def put_account(self, pubkey: str, data: bytes) -> None:
+        self._put("account", "pubkey", pubkey, data)
+
+    def get_account(self, pubkey: str) -> Optional[bytes]:
+        return self._get("account", "pubkey", pubkey)
+
+    def iter_transactions(self, batch_size: int = 1000) -> Iterator[List[Tuple[str, bytes]]]:
+        last = ""
+        while True:
+            with self.read_lock:
+                rows = self.reader.execute(
+                        "SELECT tx.signature, blob.data FROM tx JOIN blob ON blob.hash = tx.hash "
+                        "WHERE tx.signature > ? ORDER BY tx.signature LIMIT ?", (last, batch_size)).fetchall()
+            if not rows:
+                return
+            yield [(signature, zlib.decompress(data)) for signature, data in rows]
+            last = rows[-1][0]
+
+    def close(self) -> None:
+        if self.writer.is_alive():
+            self.pending.put(None)
+            self.writer.join()
+        self.reader.close()
+        self.conn.close()
+
+_caches: Dict[str, RpcCache] = {}
+
+def get_cache(path: Optional[str]) -> Optional[RpcCache]:
+    if not path:
+        return None
+    cache = _caches.get(path)
+    if not cache:
+        cache = RpcCache(path)
+        _caches[path] = cache
+        # pending puts are written before the process exits
+        atexit.register(cache.close)
+    return cache